@@ -2,49 +2,68 @@ import sublime
 import sublime_plugin
 import os
 import json
+import time
 import threading
 import copy
-import logging
-import traceback
-import sys
+import itertools
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 VERSION = int(sublime.version())
 
 if VERSION >= 3006:
     from FindKeyConflicts.lib.package_resources import *
-    from FindKeyConflicts.lib.strip_commas import strip_dangling_commas
-    from FindKeyConflicts.lib.minify_json import json_minify
+    from FindKeyConflicts.lib.keymap_cache import get_keymap_cache
+    from FindKeyConflicts.lib.profiler import NullProfiler
+    from FindKeyConflicts.lib.engine import *
+    from FindKeyConflicts.lib.conflict_diff import diff_conflicts
+    from FindKeyConflicts.lib.export import *
+    from FindKeyConflicts.lib.binding_db import BindingDatabase, parse_query
 else:
     from lib.package_resources import *
-    from lib.strip_commas import strip_dangling_commas
-    from lib.minify_json import json_minify
+    from lib.keymap_cache import get_keymap_cache
+    from lib.profiler import NullProfiler
+    from lib.engine import *
+    from lib.conflict_diff import diff_conflicts
+    from lib.export import *
+    from lib.binding_db import BindingDatabase, parse_query
 
 
-PACKAGES_PATH = sublime.packages_path()
-PLATFORM = sublime.platform().title()
-if PLATFORM == "Osx":
-    PLATFORM = "OSX"
-MODIFIERS = ('shift', 'ctrl', 'alt', 'super')
-
 DONE_TEXT = "(Done)"
 VIEW_SELECTED_LIST_TEXT = "(View Selected)"
 VIEW_PACKAGES_LIST_TEXT = "(View Packages)"
-SETTINGS_FILE = "FindKeyConflicts.sublime-settings"
 
-# Set up logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
+# Output buffers are filled with batches of roughly this many characters,
+# with at most OUTPUT_QUEUE_SIZE batches rendered ahead of the view.
+OUTPUT_BATCH_SIZE = 64 * 1024
+OUTPUT_QUEUE_SIZE = 4
 
-if not len(logger.handlers):  # Behave better on reloads
-    _handler = logging.StreamHandler(sys.stdout)
-    _formatter = logging.Formatter('[%(name)s] %(levelname)s - %(message)s')
+# Minimum number of seconds between progress updates in the status bar
+PROGRESS_INTERVAL = 0.1
 
-    _handler.setFormatter(_formatter)
-    logger.addHandler(_handler)
+BINDING_DATABASE_FILE = "FindKeyConflicts.sqlite3"
 
 
 class GenerateKeymaps(object):
-    def run(self, package=None):
+    def run(self):
+        plugin_settings = self.load_settings()
+
+        if plugin_settings.get("debug", False) or plugin_settings.get("profile", False):
+            # Debug and profile output is only produced by a fresh scan
+            thread = FindKeyConflictsCall(plugin_settings, get_packages_list())
+            thread.start()
+        else:
+            all_key_map = key_map_index.snapshot(plugin_settings)
+            if all_key_map is not None:
+                self.handle_results(all_key_map)
+                return
+            thread = key_map_index.build(plugin_settings)
+
+        self.handle_thread(thread)
+
+    def load_settings(self):
         plugin_settings = sublime.load_settings(SETTINGS_FILE)
 
         self.window = self.window
@@ -52,18 +71,17 @@ class GenerateKeymaps(object):
         self.display_internal_conflicts = plugin_settings.get(
             "display_internal_conflicts", True)
         self.show_args = plugin_settings.get("show_args", False)
-
-        packages = get_packages_list()
-        if package is None:
-            thread = FindKeyConflictsCall(plugin_settings, packages)
-        else:
-            thread = FindPackageCommandsCall(plugin_settings, package)
-
-        thread.start()
-        self.handle_thread(thread)
+        self.ignore_single_key = plugin_settings.get("ignore_single_key", False)
+        self.ignore_patterns = plugin_settings.get("ignore_patterns", [])
+        # Commands taking a context_aware argument set it on every run
+        self.context_aware = getattr(self, "context_aware_argument", None)
+        if self.context_aware is None:
+            self.context_aware = plugin_settings.get("context_aware_conflicts", False)
+        self.profiler = NullProfiler()
+        return plugin_settings
 
     def generate_package_list(self):
-        plugin_settings = sublime.load_settings("SETTINGS_FILE")
+        plugin_settings = sublime.load_settings(SETTINGS_FILE)
         view = self.window.active_view()
         packages = get_packages_list()
         packages.sort()
@@ -74,42 +92,79 @@ class GenerateKeymaps(object):
         packages = self.remove_ignored_packages(packages, ignored_packages)
         return packages
 
-    def handle_thread(self, thread, i=0, move=1):
-        if thread.is_alive():
-            # This animates a little activity indicator in the status area
-            before = i % 8
-            after = (7) - before
-            if not after:
-                move = -1
-            if not before:
-                move = 1
-            i += move
-            self.view.set_status('find_key_conflicts',
-                                 'FindKeyConflicts [%s=%s]' %
-                                 (' ' * before, ' ' * after))
-
-            # Timer to check again.
-            sublime.set_timeout(
-                lambda: self.handle_thread(thread, i, move), 100)
-        else:
-            self.view.erase_status('find_key_conflicts')
-            sublime.status_message('FindKeyConflicts finished.')
-            if thread.debug:
-                content = ""
-                for package in thread.debug_minified:
-                    content += "%s\n" % package
-                    content += "%s\n" % thread.debug_minified[package]
-
-                panel = sublime.active_window().new_file()
-                panel.set_scratch(True)
-                panel.settings().set('word_wrap', False)
-                panel.set_name("Debug")
-                panel.run_command("insert_content", {"content": content})
-            self.handle_results(thread.all_key_map)
+    def handle_thread(self, thread):
+        """
+        Show the progress of the scanning thread in the status bar and
+        handle its results once it completes.
+        """
+        self.last_progress = 0
+        thread.add_callbacks(self.on_scan_progress, self.on_scan_complete)
+
+    def on_scan_progress(self, thread, done, total):
+        # Called from the scanning thread
+        now = time.time()
+        if done < total and now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        sublime.set_timeout(lambda: self.view.set_status(
+            'find_key_conflicts',
+            'FindKeyConflicts [%d of %d packages]' % (done, total)), 0)
+
+    def on_scan_complete(self, thread):
+        # Called from the scanning thread
+        sublime.set_timeout(lambda: self.handle_scan_complete(thread), 0)
+
+    def handle_scan_complete(self, thread):
+        self.view.erase_status('find_key_conflicts')
+        if thread.failed:
+            sublime.status_message('FindKeyConflicts failed. See console for details.')
+            return
+        if thread.cancelled:
+            sublime.status_message('FindKeyConflicts cancelled.')
+            return
+
+        sublime.status_message('FindKeyConflicts finished.')
+        self.profiler = thread.profiler
+        if thread.debug:
+            content = []
+            for package in thread.debug_minified:
+                content.append("%s\n" % package)
+                content.append("%s\n" % thread.debug_minified[package])
+
+            panel = sublime.active_window().new_file()
+            panel.set_scratch(True)
+            panel.settings().set('word_wrap', False)
+            panel.set_name("Debug")
+            panel.run_command("insert_content", {"content": "".join(content)})
+        self.handle_results(thread.all_key_map)
 
     def handle_results(self, all_key_map):
         raise NotImplementedError("Should have implemented this")
 
+    def export(self, records, name):
+        """
+        Ask for a file and stream records to it in the format given by the
+        output argument.
+        """
+        path = os.path.join(os.path.expanduser("~"), "%s.%s" % (name, self.output))
+        self.window.show_input_panel("Export to:", path,
+                                     lambda file_name: self.start_export(records, file_name),
+                                     None, None)
+
+    def start_export(self, records, path):
+        self.view.set_status('find_key_conflicts', 'FindKeyConflicts [exporting]')
+        threading.Thread(target=self.export_records, args=(records, path)).start()
+
+    def export_records(self, records, path):
+        try:
+            count = export_records(records, path, self.output)
+            message = "FindKeyConflicts: Exported %d bindings to %s" % (count, path)
+        except (IOError, OSError) as error:
+            message = "FindKeyConflicts: Unable to export to %s: %s" % (path, error)
+            logger.warning(message)
+        sublime.set_timeout(lambda: self.view.erase_status('find_key_conflicts'), 0)
+        sublime.set_timeout(lambda: sublime.status_message(message), 0)
+
     def remove_ignored_packages(self, packages, ignored_packages):
         for ignored_package in ignored_packages:
             try:
@@ -120,104 +175,63 @@ class GenerateKeymaps(object):
 
         return packages
 
-    def remove_non_conflicts(self, all_key_map):
-        keylist = list(all_key_map.keys())
+    def remove_ignored_keys(self, all_key_map):
+        """
+        Return the key map conflicts are found in, without the ignored keys.
+        """
+        return remove_ignored_keys(all_key_map, self.ignore_single_key, self.ignore_patterns)
 
-        keylist.sort()
-        new_key_map = {}
-        for key in keylist:
-            value = all_key_map[key]
-            if len(value["packages"]) > 1:
-                new_key_map[key] = value
-            elif len(value[value["packages"][0]]) > 1 and self.display_internal_conflicts:
-                new_key_map[key] = value
-        return new_key_map
+    def remove_non_conflicts(self, all_key_map):
+        all_key_map = self.remove_ignored_keys(all_key_map)
+        with self.profiler.time("remove_non_conflicts"):
+            if isinstance(all_key_map, KeyMapSnapshot):
+                return all_key_map.direct_conflicts(self.display_internal_conflicts, self.context_aware)
+            return remove_non_conflicts(all_key_map, self.display_internal_conflicts, self.context_aware)
 
     def find_overlap_conflicts(self, all_key_map):
-        keylist = list(all_key_map.keys())
-        keylist.sort()
-        conflicts = {}
-        for key in keylist:
-            for key_nested in keylist:
-                if key_nested.startswith(key + ","):
-                    if key in conflicts:
-                        conflicts[key].append(key_nested)
-                    else:
-                        conflicts[key] = [key_nested]
-        return conflicts
+        all_key_map = self.remove_ignored_keys(all_key_map)
+        with self.profiler.time("find_overlap_conflicts"):
+            if isinstance(all_key_map, KeyMapSnapshot):
+                return all_key_map.overlap_conflicts()
+            return find_overlap_conflicts(all_key_map)
 
 
-class GenerateOutput(object):
-    def __init__(self, all_key_map, show_args, window=None):
+def show_profile_report(profiler):
+    panel = sublime.active_window().new_file()
+    panel.set_scratch(True)
+    panel.settings().set('word_wrap', False)
+    panel.set_name("FindKeyConflicts Profile")
+    panel.run_command("insert_content", {"content": profiler.generate_report()})
+
+
+class GenerateOutput(GenerateText):
+    def __init__(self, all_key_map, show_args, window=None, profiler=None):
+        GenerateText.__init__(self, all_key_map, show_args)
         self.window = window
-        self.all_key_map = all_key_map
-        self.show_args = show_args
-
-    def generate_header(self, header):
-        return '%s\n%s\n%s\n' % ('-' * len(header), header, '-' * len(header))
-
-    def generate_overlapping_key_text(self, conflict_map):
-        content = ""
-        keys = list(conflict_map.keys())
-        keys.sort()
-        potential_conflicts_keys = list(conflict_map.keys())
-        potential_conflicts_keys.sort()
-        offset = 2
-        for key_string in potential_conflicts_keys:
-            content += self.generate_text(key_string, self.all_key_map, 0)
-            for conflict in conflict_map[key_string]:
-                content += self.generate_text(conflict, self.all_key_map,
-                                              offset, "(", ")")
-        return content
-
-    def generate_key_map_text(self, key_map):
-        content = ''
-        keys = list(key_map.keys())
-
-        keys.sort()
-        for key_string in keys:
-            content += self.generate_text(key_string, key_map)
-
-        return content
+        self.profiler = profiler or NullProfiler()
+
+    def show_profile(self):
+        """
+        Open the profile report, once per scan.
+        """
+        if self.profiler.enabled:
+            show_profile_report(self.profiler)
+            self.profiler = NullProfiler()
 
     def generate_file(self, content, name="Keys"):
+        """
+        Open a scratch view and fill it with content, an iterable of
+        strings. The content is rendered on a background thread and
+        inserted in batches, so the view fills without blocking the UI.
+        """
         panel = sublime.active_window().new_file()
         panel.set_scratch(True)
         panel.settings().set('word_wrap', False)
         panel.set_name(name)
         # content output
-        panel.run_command("insert_content", {"content": content})
-
-    def longest_command_length(self, key_map):
-        pass
-
-    def longest_package_length(self, key_map):
-        pass
-
-    def generate_text(self, key_string, key_map, offset=0, key_wrap_in='[',
-                      key_wrap_out=']'):
-        content = ''
-        item = key_map.get(key_string)
-        content += " " * offset
-        content += ' %s%s%s\n' % (key_wrap_in, key_string, key_wrap_out)
-        packages = item.get("packages")
-        misconfigured_command_message = ''
-        for package in packages:
-            package_map = item.get(package)
-            for entry in package_map:
-                if 'command' not in entry:
-                    misconfigured_command_message += '%s in %s does not ' \
-                        'have a command\n' % (key_string, package)
-                    continue
-                content += " " * offset
-                content += '   %*s %*s  %s\n' % \
-                    (-40 + offset, entry['command'], -20, package,
-                     json.dumps(entry['context']) if "context" in entry else '')
-
-        if misconfigured_command_message:
-            sublime.error_message(misconfigured_command_message)
-
-        return content
+        thread = StreamContentCall(panel, content, self.profiler, self.show_profile)
+        thread.start()
+        sublime.set_timeout(thread.insert_next_batch, 0)
 
     def generate_output_quick_panel(self, key_map):
         self.key_map = key_map
@@ -233,61 +247,162 @@ class GenerateOutput(object):
 
         self.window.show_quick_panel(quick_panel_items,
                                      self.quick_panel_callback)
+        self.show_profile()
 
     def quick_panel_callback(self, index):
         if index == -1:
             return
         entry = self.list[index]
-        content = self.generate_header("Entry Details")
-        content += self.generate_text(entry, self.key_map)
+        content = [
+            self.generate_header("Entry Details"),
+            self.generate_text(entry, self.key_map)
+        ]
         self.generate_file(content, "[%s] Details" % entry)
 
 
+class StreamContentCall(threading.Thread):
+    def __init__(self, view, content, profiler=None, on_done=None):
+        self.view = view
+        self.content = content
+        self.profiler = profiler or NullProfiler()
+        self.on_done = on_done
+        self.batches = queue.Queue(OUTPUT_QUEUE_SIZE)
+        threading.Thread.__init__(self)
+
+    def run(self):
+        batch = []
+        batch_size = 0
+        start = time.time()
+        try:
+            for chunk in self.content:
+                batch.append(chunk)
+                batch_size += len(chunk)
+                if batch_size >= OUTPUT_BATCH_SIZE:
+                    # Time spent waiting for the view is not rendering
+                    self.profiler.record("render", time.time() - start, size=batch_size)
+                    self.batches.put("".join(batch))
+                    batch = []
+                    batch_size = 0
+                    start = time.time()
+        finally:
+            self.profiler.record("render", time.time() - start, size=batch_size)
+            self.batches.put("".join(batch))
+            self.batches.put(None)
+
+    def insert_next_batch(self):
+        """
+        Insert one batch into the view. Runs on the UI thread and
+        reschedules itself until the content is exhausted.
+        """
+        try:
+            content = self.batches.get_nowait()
+        except queue.Empty:
+            sublime.set_timeout(self.insert_next_batch, 10)
+            return
+
+        if content is None:
+            if self.on_done is not None:
+                self.on_done()
+            return
+        if content:
+            with self.profiler.time("insert_content") as timer:
+                timer.size = len(content)
+                self.view.run_command("insert_content", {"content": content, "append": True})
+        sublime.set_timeout(self.insert_next_batch, 0)
+
+
 class FindKeyConflictsCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
-    def run(self, output="quick_panel"):
+    def run(self, output="quick_panel", context_aware=None):
         self.output = output
+        self.context_aware_argument = context_aware
         GenerateKeymaps.run(self)
 
     def handle_results(self, all_key_map):
-        output = GenerateOutput(all_key_map, self.show_args, self.window)
+        output = GenerateOutput(all_key_map, self.show_args, self.window, self.profiler)
 
         new_key_map = self.remove_non_conflicts(all_key_map)
         if self.output == "quick_panel":
             output.generate_output_quick_panel(new_key_map)
         elif self.output == "buffer":
-            content = output.generate_header("Key Conflicts (Only direct conflicts)")
-            content += output.generate_key_map_text(new_key_map)
+            content = itertools.chain(
+                [output.generate_header("Key Conflicts (Only direct conflicts)")],
+                output.generate_key_map_text(new_key_map))
             output.generate_file(content, "Key Conflicts")
+        elif self.output in EXPORT_FORMATS:
+            self.export(iter_binding_records(new_key_map, "direct"), "key_conflicts")
         else:
             logger.warning("FindKeyConflicts[Warning]: Invalid output type specified")
 
 
 class FindAllKeyConflictsCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
-    def run(self):
+    def run(self, output="buffer", context_aware=None):
+        self.output = output
+        self.context_aware_argument = context_aware
         GenerateKeymaps.run(self)
 
     def handle_results(self, all_key_map):
-        output = GenerateOutput(all_key_map, self.show_args)
+        output = GenerateOutput(all_key_map, self.show_args, profiler=self.profiler)
         new_key_map = self.remove_non_conflicts(all_key_map)
         overlapping_confilicts_map = self.find_overlap_conflicts(all_key_map)
 
-        content = output.generate_header("Multi Part Key Conflicts")
-        content += output.generate_overlapping_key_text(overlapping_confilicts_map)
-        content += output.generate_header("Key Conflicts (Only direct conflicts)")
-        content += output.generate_key_map_text(new_key_map)
+        if self.output in EXPORT_FORMATS:
+            records = itertools.chain(
+                iter_overlap_records(all_key_map, overlapping_confilicts_map),
+                iter_binding_records(new_key_map, "direct"))
+            self.export(records, "all_key_conflicts")
+            return
+
+        content = itertools.chain(
+            [output.generate_header("Multi Part Key Conflicts")],
+            output.generate_overlapping_key_text(overlapping_confilicts_map),
+            [output.generate_header("Key Conflicts (Only direct conflicts)")],
+            output.generate_key_map_text(new_key_map))
         output.generate_file(content,  "All Key Conflicts")
 
 
+class FindKeyConflictsAllPlatformsCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
+    def run(self, context_aware=None):
+        self.context_aware_argument = context_aware
+        plugin_settings = self.load_settings()
+        thread = MultiPlatformCall(plugin_settings, get_packages_list())
+        thread.start()
+        self.handle_thread(thread)
+
+    def handle_scan_complete(self, thread):
+        self.platform_key_maps = thread.platform_key_maps
+        GenerateKeymaps.handle_scan_complete(self, thread)
+
+    def handle_results(self, all_key_map):
+        chunks = []
+        platform_conflicts = {}
+        for platform in PLATFORMS:
+            platform_key_map = self.platform_key_maps[platform]
+            output = GenerateOutput(platform_key_map, self.show_args, profiler=self.profiler)
+            platform_conflicts[platform] = self.remove_non_conflicts(platform_key_map)
+            chunks.extend([
+                [output.generate_header("%s Multi Part Key Conflicts" % platform)],
+                output.generate_overlapping_key_text(self.find_overlap_conflicts(platform_key_map)),
+                [output.generate_header("%s Key Conflicts (Only direct conflicts)" % platform)],
+                output.generate_key_map_text(platform_conflicts[platform])])
+
+        unique_conflicts = find_unique_conflicts(platform_conflicts)
+        for platform in PLATFORMS:
+            chunks.append([output.generate_header("Key Conflicts Only On %s" % platform)])
+            chunks.append(output.generate_key_map_text(unique_conflicts[platform]))
+        output.generate_file(itertools.chain(*chunks), "All Platforms Key Conflicts")
+
+
 class FindOverlapConflictsCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
     def run(self):
         GenerateKeymaps.run(self)
 
     def handle_results(self, all_key_map):
-        output = GenerateOutput(all_key_map, self.show_args)
+        output = GenerateOutput(all_key_map, self.show_args, profiler=self.profiler)
         overlapping_confilicts_map = self.find_overlap_conflicts(all_key_map)
 
-        content = output.generate_header("Multi Part Key Conflicts")
-        content += output.generate_overlapping_key_text(overlapping_confilicts_map)
+        content = itertools.chain(
+            [output.generate_header("Multi Part Key Conflicts")],
+            output.generate_overlapping_key_text(overlapping_confilicts_map))
         output.generate_file(content,  "Overlap Key Conflicts")
 
 
@@ -297,17 +412,93 @@ class FindKeyMappingsCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
         GenerateKeymaps.run(self)
 
     def handle_results(self, all_key_map):
-        output = GenerateOutput(all_key_map, self.show_args, self.window)
+        all_key_map = self.remove_ignored_keys(all_key_map)
+        output = GenerateOutput(all_key_map, self.show_args, self.window, self.profiler)
         if self.output == "quick_panel":
             output.generate_output_quick_panel(all_key_map)
         elif self.output == "buffer":
-            content = output.generate_header("All Key Mappings")
-            content += output.generate_key_map_text(all_key_map)
+            content = itertools.chain(
+                [output.generate_header("All Key Mappings")],
+                output.generate_key_map_text(all_key_map))
             output.generate_file(content, "All Key Mappings")
+        elif self.output in EXPORT_FORMATS:
+            self.export(iter_binding_records(all_key_map), "key_mappings")
         else:
             logger.warning("FindKeyConflicts[Warning]: Invalid output type specified")
 
 
+class FindKeyConflictsLookupCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
+    def run(self, keys=None):
+        if keys is not None:
+            self.keys = keys
+            GenerateKeymaps.run(self)
+            return
+
+        plugin_settings = self.load_settings()
+        if key_map_index.snapshot(plugin_settings) is None:
+            # Build the index while the keys are typed
+            key_map_index.build(plugin_settings)
+        self.window.show_input_panel("Key sequence:", "", self.on_done, self.on_change, None)
+
+    def on_change(self, text):
+        all_key_map = key_map_index.snapshot(sublime.load_settings(SETTINGS_FILE))
+        key_string = normalize_key_sequence(text)
+        if all_key_map is None or key_string is None:
+            return
+        bucket, longer_keys = all_key_map.lookup(key_string)
+        count = 0
+        if bucket is not None:
+            count = sum([len(bucket[package]) for package in bucket["packages"]])
+        sublime.status_message("FindKeyConflicts: [%s] %d bindings, %d longer sequences" % (
+            key_string, count, len(longer_keys)))
+
+    def on_done(self, text):
+        self.keys = text
+        GenerateKeymaps.run(self)
+
+    def handle_results(self, all_key_map):
+        key_string = normalize_key_sequence(self.keys)
+        if key_string is None:
+            return
+        if isinstance(all_key_map, KeyMapSnapshot):
+            bucket, longer_keys = all_key_map.lookup(key_string)
+        else:
+            bucket = all_key_map.get(key_string)
+            longer_keys = find_key_overlaps(key_string, sorted(all_key_map))
+        if bucket is None and not longer_keys:
+            sublime.status_message("FindKeyConflicts: [%s] is not bound" % key_string)
+            return
+
+        self.all_key_map = all_key_map
+        self.list = []
+        quick_panel_items = []
+        # Ignored keys are bound all the same, so they are listed and marked
+        unignored_key_map = self.remove_ignored_keys(all_key_map)
+        for lookup_key in ([key_string] if bucket is not None else []) + longer_keys:
+            lookup_bucket = all_key_map[lookup_key]
+            ignored = "" if lookup_key in unignored_key_map else " [ignored]"
+            for package in lookup_bucket["packages"]:
+                for entry in lookup_bucket[package]:
+                    self.list.append(lookup_key)
+                    quick_panel_items.append([
+                        lookup_key + ignored,
+                        "%s (%s)" % (entry.get("command"), package),
+                        "args: %s  context: %s" % (json.dumps(entry.get("args")),
+                                                   json.dumps(entry.get("context")))])
+        self.window.show_quick_panel(quick_panel_items, self.quick_panel_callback)
+
+    def quick_panel_callback(self, index):
+        if index == -1:
+            return
+        entry = self.list[index]
+        output = GenerateOutput(self.all_key_map, self.show_args)
+        content = [
+            output.generate_header("Entry Details"),
+            output.generate_text(entry, self.all_key_map)
+        ]
+        output.generate_file(content, "[%s] Details" % entry)
+
+
 class FindKeyConflictsWithPackageCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
     def run(self, multiple=False):
         self.package_list = [entry for entry in GenerateKeymaps.generate_package_list(self)]
@@ -362,66 +553,182 @@ class FindKeyConflictsWithPackageCommand(GenerateKeymaps, sublime_plugin.WindowC
             self.generate_quick_panel(self.package_list, self.package_list_callback, False)
 
     def handle_results(self, all_key_map):
-        output = GenerateOutput(all_key_map, self.show_args)
-
-        output_keymap = {}
-        overlapping_conflicts_map = {}
-        conflict_key_map = self.remove_non_conflicts(all_key_map)
-        all_overlapping_confilicts_map = self.find_overlap_conflicts(all_key_map)
-        for key in conflict_key_map:
-            package_list = conflict_key_map[key]["packages"]
-            for package in self.selected_list:
-                if package in package_list:
-                    output_keymap[key] = conflict_key_map[key]
-                    break
-
-        for overlap_base_key in all_overlapping_confilicts_map:
-            for package in self.selected_list:
-                if package in all_key_map[overlap_base_key]["packages"]:
-                    overlapping_conflicts_map[overlap_base_key] = all_overlapping_confilicts_map[overlap_base_key]
-                    break
-
-            for overlap_key in all_overlapping_confilicts_map[overlap_base_key]:
-                if package in all_key_map[overlap_key]["packages"]:
-                    overlapping_conflicts_map[overlap_base_key] = all_overlapping_confilicts_map[overlap_base_key]
-                    break
-
-        content = "Key conflicts involving the following packages:\n"
-        content += ", ".join(self.selected_list) + "\n\n"
-
-        content += output.generate_header("Multi Part Key Conflicts")
-        content += output.generate_overlapping_key_text(overlapping_conflicts_map)
-        content += output.generate_header("Key Conflicts")
-        content += output.generate_key_map_text(output_keymap)
+        output = GenerateOutput(all_key_map, self.show_args, profiler=self.profiler)
+
+        with self.profiler.time("find_package_conflicts"):
+            output_keymap, overlapping_conflicts_map = find_package_conflicts(
+                self.remove_ignored_keys(all_key_map), self.selected_list, self.display_internal_conflicts, self.context_aware)
+
+        content = itertools.chain(
+            ["Key conflicts involving the following packages:\n",
+             ", ".join(self.selected_list) + "\n\n",
+             output.generate_header("Multi Part Key Conflicts")],
+            output.generate_overlapping_key_text(overlapping_conflicts_map),
+            [output.generate_header("Key Conflicts")],
+            output.generate_key_map_text(output_keymap))
         output.generate_file(content, "Key Conflicts")
 
 
-class FindKeyConflictsCommandSearchCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
+class FindKeyConflictsDiffCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
     def run(self):
-        packages = [entry for entry in GenerateKeymaps.generate_package_list(self)]
-        self.package_list = []
+        self.load_settings()
+        self.view.set_status('find_key_conflicts', 'FindKeyConflicts [comparing]')
+        threading.Thread(target=self.compare).start()
+
+    def compare(self):
+        settings = sublime.load_settings(SETTINGS_FILE)
+        key_map_index.wait_for_snapshot(settings)
+        key_map_index.refresh_changed_packages()
+        states = key_map_index.take_diff_states(settings)
+        if states is None:
+            sublime.set_timeout(lambda: self.view.erase_status('find_key_conflicts'), 0)
+            return
+
+        old_key_map, new_key_map, packages = states
+        diff = diff_conflicts(self.remove_ignored_keys(old_key_map),
+                              self.remove_ignored_keys(new_key_map), packages,
+                              self.display_internal_conflicts, self.context_aware)
+        sublime.set_timeout(lambda: self.handle_diff(old_key_map, new_key_map, packages, diff), 0)
+
+    def handle_diff(self, old_key_map, new_key_map, packages, diff):
+        self.view.erase_status('find_key_conflicts')
+        old_output = GenerateOutput(old_key_map, self.show_args)
+        output = GenerateOutput(new_key_map, self.show_args)
 
-        for package in packages:
-            if len(find_resource("Default( \(%s\))?.sublime-keymap$" % PLATFORM, package)) > 0:
-                self.package_list.append(package)
+        summary = ["Conflict changes since %s\n" % time.strftime("%H:%M:%S", time.localtime(old_key_map.created))]
+        if packages is None:
+            summary.append("The key bindings of all packages were collected again.\n\n")
+        else:
+            summary.append("Packages with changed keymaps: %s\n\n" % (", ".join(sorted(packages)) or "(none)"))
+        if diff.is_empty():
+            summary.append("No conflicts were added, removed or changed.\n")
+
+        content = itertools.chain(
+            summary,
+            [output.generate_header("Added Multi Part Key Conflicts")],
+            output.generate_overlapping_key_text(diff.added_overlaps),
+            [old_output.generate_header("Removed Multi Part Key Conflicts")],
+            old_output.generate_overlapping_key_text(diff.removed_overlaps),
+            [output.generate_header("Changed Multi Part Key Conflicts")],
+            output.generate_overlapping_key_text(diff.changed_overlaps),
+            [output.generate_header("Added Key Conflicts")],
+            output.generate_key_map_text(diff.added_conflicts),
+            [old_output.generate_header("Removed Key Conflicts")],
+            old_output.generate_key_map_text(diff.removed_conflicts),
+            [output.generate_header("Changed Key Conflicts")],
+            output.generate_key_map_text(diff.changed_conflicts))
+        output.generate_file(content, "Conflict Diff")
+
+
+class FindKeyConflictsQueryCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
+    def run(self, query=None):
+        self.load_settings()
+        if query is None:
+            self.window.show_input_panel("Query bindings:", "", self.start_query, None, None)
+        else:
+            self.start_query(query)
 
-        self.generate_quick_panel(self.package_list, self.package_list_callback)
+    def start_query(self, text):
+        try:
+            query = parse_query(text)
+        except ValueError as error:
+            sublime.error_message("FindKeyConflicts: %s" % error)
+            return
+        self.view.set_status('find_key_conflicts', 'FindKeyConflicts [querying]')
+        threading.Thread(target=self.run_query, args=(text, query)).start()
+
+    def run_query(self, text, query):
+        settings = sublime.load_settings(SETTINGS_FILE)
+        snapshot = key_map_index.wait_for_snapshot(settings)
+        if snapshot is None:
+            sublime.set_timeout(lambda: self.view.erase_status('find_key_conflicts'), 0)
+            return
+
+        path = get_binding_database_path(settings)
+        try:
+            database = BindingDatabase(path)
+            try:
+                # The database is only written again once the bindings changed
+                if database.get_created() != snapshot.created:
+                    database.write(snapshot, snapshot.created)
+                if query.min_bindings is not None:
+                    result = database.count_package_bindings(query)
+                else:
+                    result = database.find_bindings(query)
+            finally:
+                database.close()
+        except Exception as error:
+            message = "FindKeyConflicts: Unable to query %s: %s" % (path, error)
+            logger.warning(message)
+            sublime.set_timeout(lambda: self.view.erase_status('find_key_conflicts'), 0)
+            sublime.set_timeout(lambda: sublime.error_message(message), 0)
+            return
+        sublime.set_timeout(lambda: self.handle_query(text, query, result), 0)
+
+    def handle_query(self, text, query, result):
+        self.view.erase_status('find_key_conflicts')
+        output = GenerateOutput(result if query.min_bindings is None else {}, self.show_args)
+        header = [output.generate_header("Query: %s" % text)]
+        if query.min_bindings is not None:
+            content = ["%-40s %d\n" % (package, count) for package, count in result]
+        else:
+            content = output.generate_key_map_text(result)
+        output.generate_file(itertools.chain(header, content), "Binding Query")
 
-    def generate_quick_panel(self, packages, callback):
-        self.window.show_quick_panel(packages, callback)
+
+def get_binding_database_path(settings):
+    path = settings.get("binding_database", "")
+    if path:
+        return os.path.expanduser(path)
+    if hasattr(sublime, "cache_path") and sublime.cache_path() is not None:
+        directory = os.path.join(sublime.cache_path(), "FindKeyConflicts")
+    else:
+        directory = os.path.join(sublime.packages_path(), "User")
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    return os.path.join(directory, BINDING_DATABASE_FILE)
+
+
+class FindKeyConflictsCommandSearchCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
+    def run(self, all_packages=False):
+        self.all_packages = all_packages
+        GenerateKeymaps.run(self)
+
+    def handle_results(self, all_key_map):
+        if isinstance(all_key_map, KeyMapSnapshot):
+            self.command_index = all_key_map.command_index()
+        else:
+            # Debug and profile scans are not kept in the index
+            self.command_index = CommandIndex(all_key_map)
+        packages = set(self.generate_package_list())
+
+        if self.all_packages:
+            self.show_commands([entry for entry in self.command_index.get_entries()
+                                if entry[0] in packages])
+        else:
+            self.package_list = [package for package in self.command_index.packages
+                                 if package in packages]
+            self.window.show_quick_panel(self.package_list, self.package_list_callback)
+        if self.profiler.enabled:
+            show_profile_report(self.profiler)
 
     def package_list_callback(self, index):
         if index == -1:
             return
-        GenerateKeymaps.run(self, self.package_list[index])
+        package = self.package_list[index]
+        sublime.set_timeout(lambda: self.show_commands(self.command_index.get_entries(package)), 10)
 
-    def handle_results(self, key_binding_commands):
-        self.key_bindings = key_binding_commands
+    def show_commands(self, command_entries):
+        self.key_bindings = []
         entries = []
-        for key_entry in key_binding_commands:
+        for package, key_string, key_entry in command_entries:
+            self.key_bindings.append(key_entry)
             entry = []
             entry.append(str(key_entry["command"]))
-            entry.append(str(key_entry["keys"]))
+            if self.all_packages:
+                entry.append("%s (%s)" % (key_string, package))
+            else:
+                entry.append(key_string)
             if "args" in key_entry:
                 entry.append(str(key_entry["args"]))
             entries.append(entry)
@@ -441,170 +748,76 @@ class FindKeyConflictsCommandSearchCommand(GenerateKeymaps, sublime_plugin.Windo
         sublime.run_command(command, args)
 
 
-class ThreadBase(threading.Thread):
-    def manage_package(self, package):
-        self.done = False
-        file_list = list_package_files(package)
-        platform_keymap = "default (%s).sublime-keymap" % (PLATFORM.lower())
-        for filename in file_list:
-            if filename.lower().endswith("default.sublime-keymap") or filename.lower().endswith(platform_keymap):
-                content = get_resource(package, filename)
-                if content is None:
-                    continue
-
-                try:
-                    if VERSION < 3013:
-                        minified_content = json_minify(content)
-                        minified_content = strip_dangling_commas(minified_content)
-                        minified_content = minified_content.replace("\n", "\\\n")
-                        if self.debug:
-                            self.debug_minified[package] = minified_content
-                        key_map = json.loads(minified_content)
-                    else:
-                        key_map = sublime.decode_value(content)
-                except:
-                    if not self.prev_error:
-                        traceback.print_exc()
-                        self.prev_error = True
-                        sublime.error_message("Could not parse a keymap file. See console for details")
-                    #error_path = os.path.join(os.path.basename(orig_path), filename)
-                    logger.warning("FindKeyConflicts[Warning]: An error " + "occured while parsing '" + package + "'")
-                    continue
-                if key_map is not None:
-                    self.handle_key_map(package, key_map)
-        self.done = True
-
-    def check_ignore(self, key_array):
-        if ",".join(key_array) in self.ignore_patterns:
-            return True
-        if len(key_array) > 1 or not self.ignore_single_key:
-            return False
-
-        for key_string in key_array:
-            split_keys = key_string.split("+")
-            try:
-                i = split_keys.index("")
-                split_keys[i] = "+"
-                split_keys.remove("")
-            except:
-                pass
+class FindKeyConflictsListener(sublime_plugin.EventListener):
+    def on_post_save(self, view):
+        file_name = view.file_name()
+        if file_name is None or not file_name.endswith(".sublime-keymap"):
+            return
+        if not os.path.realpath(file_name).startswith(os.path.realpath(sublime.packages_path())):
+            return
 
-            if len(split_keys) == 1 and self.ignore_single_key:
-                return True
+        package, resource = get_package_and_resource_name(file_name)
+        if package is not None:
+            threading.Thread(target=key_map_index.refresh_packages,
+                             args=([package],)).start()
 
-        return False
 
-    def order_key_string(self, key_string):
-        split_keys = key_string.split("+")
-        try:
-            i = split_keys.index("")
-            split_keys[i] = "+"
-            split_keys.remove("")
-        except:
-            pass
-
-        modifiers = []
-        keys = []
-        for key in split_keys:
-            if key in MODIFIERS:
-                modifiers.append(key)
-            else:
-                keys.append(key)
-        modifiers.sort()
-        keys.sort()
-        ordered_key_string = "+".join(modifiers + keys)
-        return ordered_key_string
+def plugin_loaded():
+    for settings_file in ("Preferences.sublime-settings", SETTINGS_FILE):
+        settings = sublime.load_settings(settings_file)
+        settings.clear_on_change("find_key_conflicts")
+        settings.add_on_change("find_key_conflicts", key_map_index.on_settings_changed)
 
-    def handle_key_map(self, package, key_map):
-        raise NotImplementedError("Should have implemented this")
 
+def plugin_unloaded():
+    for settings_file in ("Preferences.sublime-settings", SETTINGS_FILE):
+        sublime.load_settings(settings_file).clear_on_change("find_key_conflicts")
 
-class FindKeyConflictsCall(ThreadBase):
-    def __init__(self, settings, packages):
-        self.ignore_single_key = settings.get("ignore_single_key", False)
-        self.ignore_patterns = settings.get("ignore_patterns", [])
-        self.packages = packages
-        self.all_key_map = {}
-        self.debug_minified = {}
-        self.debug = settings.get("debug", False)
-        self.prev_error = False
-        threading.Thread.__init__(self)
 
+if VERSION < 3000:
+    plugin_loaded()
+
+
+class FindKeyConflictsCancelScanCommand(sublime_plugin.WindowCommand):
     def run(self):
-        run_user = False
-        temp = []
-        for ignore_pattern in self.ignore_patterns:
-            temp.append(self.order_key_string(ignore_pattern))
-        self.ignore_patterns = temp
-        if "Default" in self.packages:
-            self.manage_package("Default")
-            self.packages.remove("Default")
-        if "User" in self.packages:
-            run_user = True
-            self.packages.remove("User")
-
-        for package in self.packages:
-            self.manage_package(package)
-        if run_user:
-            self.manage_package("User")
-
-    def handle_key_map(self, package, key_map):
-        for entry in key_map:
-            keys = entry["keys"]
-            # if "context" in entry:
-            #     print(entry["context"])
-            #     entry["context"].sort()
-            key_array = []
-            key_string = ""
-            for key in keys:
-                key_array.append(self.order_key_string(key))
-
-            if self.check_ignore(key_array):
-                continue
-            key_string = ",".join(key_array)
-
-            if key_string in self.all_key_map:
-                tmp = self.all_key_map.get(key_string)
-                if package not in tmp["packages"]:
-                    tmp["packages"].append(package)
-                    tmp[package] = [entry]
-                else:
-                    tmp[package].append(entry)
+        for thread in get_running_scans():
+            thread.cancel()
 
-                self.all_key_map[key_string] = tmp
-            else:
-                new_entry = {}
-                new_entry["packages"] = [package]
-                new_entry[package] = [entry]
-                self.all_key_map[key_string] = new_entry
-
-
-class FindPackageCommandsCall(ThreadBase):
-    def __init__(self, settings, package):
-        self.package = package
-        self.all_key_map = []
-        self.debug_minified = {}
-        self.debug = settings.get("debug", False)
-        self.prev_error = False
-        threading.Thread.__init__(self)
+    def is_enabled(self):
+        return len(get_running_scans()) > 0
 
+
+class FindKeyConflictsPartialResultsCommand(GenerateKeymaps, sublime_plugin.WindowCommand):
     def run(self):
-        self.manage_package(self.package)
+        self.load_settings()
+        for thread in get_running_scans():
+            if isinstance(thread, FindKeyConflictsCall):
+                break
+        else:
+            sublime.status_message("FindKeyConflicts: No scan is running.")
+            return
+
+        done, total = thread.progress
+        all_key_map = thread.partial_key_map()
+        output = GenerateOutput(all_key_map, self.show_args, profiler=self.profiler)
+        content = itertools.chain(
+            [output.generate_header("Key Conflicts (%d of %d packages scanned)" % (done, total))],
+            output.generate_key_map_text(self.remove_non_conflicts(all_key_map)))
+        output.generate_file(content, "Partial Key Conflicts")
 
-    def handle_key_map(self, package, key_map):
-        for entry in key_map:
-            keys = entry["keys"]
-            key_array = []
-            key_string = ""
-            for key in keys:
-                key_array.append(self.order_key_string(key))
+    def is_enabled(self):
+        return len(get_running_scans()) > 0
 
-            key_string = ",".join(key_array)
 
-            entry["keys"] = key_string
-            self.all_key_map.append(entry)
+class FindKeyConflictsClearCacheCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        keymap_cache = get_keymap_cache()
+        if keymap_cache is not None:
+            keymap_cache.clear()
+        key_map_index.invalidate()
+        sublime.status_message("FindKeyConflicts: Keymap cache cleared.")
 
 
 class InsertContentCommand(sublime_plugin.TextCommand):
-    def run(self, edit, content):
-        self.view.insert(edit, 0, content)
+    def run(self, edit, content, append=False):
+        self.view.insert(edit, self.view.size() if append else 0, content)
@@ -0,0 +1,365 @@
+"""
+Benchmarks the scanning stages against synthetic installs.
+
+Each configuration generates a packages tree with a mix of loose folders
+and .sublime-package archives, then times every stage of a scan
+separately. Results are written as JSON so runs can be compared.
+
+Usage:
+    python -m lib.benchmark [--preset small|medium|large] [options]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+import argparse
+import platform
+
+from . import chords
+from .host import set_host
+from .stub_host import StubHost
+
+__all__ = [
+    "PRESETS",
+    "generate_corpus",
+    "run_benchmark",
+    "main"
+]
+
+PRESETS = {
+    "small": {"packages": 10, "bindings": 1000},
+    "medium": {"packages": 200, "bindings": 20000},
+    "large": {"packages": 2000, "bindings": 200000}
+}
+
+MODIFIER_POOL = ("ctrl", "shift", "alt", "super")
+KEY_POOL = tuple("abcdefghijklmnopqrstuvwxyz0123456789") + (
+    "enter", "tab", "escape", "space", "backspace", "delete", "up", "down",
+    "left", "right", "home", "end", "pageup", "pagedown", "+", ",", "/",
+    "f1", "f2", "f3", "f4", "f5", "f6", "f7", "f8", "f9", "f10", "f11", "f12")
+CONTEXT_KEYS = ("selector", "setting.auto_complete", "panel_visible",
+                "overlay_visible", "num_selections", "preceding_text",
+                "following_text", "auto_complete_visible")
+
+
+def _random_chord(rng):
+    modifiers = rng.sample(MODIFIER_POOL, rng.choice((0, 1, 1, 2, 2, 3)))
+    # Keys are written in arbitrary order so normalization has work to do
+    parts = modifiers + [rng.choice(KEY_POOL)]
+    rng.shuffle(parts)
+    return "+".join(parts)
+
+
+def _random_binding(rng, config, chord_pool):
+    if chord_pool and rng.random() < config["duplicate_rate"]:
+        keys = list(rng.choice(chord_pool))
+    else:
+        length = 1
+        while length < config["chord_length"] and rng.random() < 0.3:
+            length += 1
+        keys = [_random_chord(rng) for i in range(length)]
+        chord_pool.append(keys)
+
+    binding = {"keys": keys, "command": "command_%d" % rng.randint(0, 500)}
+    if rng.random() < 0.3:
+        binding["args"] = {"value": rng.randint(0, 10)}
+    context_size = rng.randint(0, config["context_size"])
+    if context_size:
+        binding["context"] = [
+            {"key": rng.choice(CONTEXT_KEYS), "operator": "equal",
+             "operand": rng.choice((True, False, "source.python", "text.plain"))}
+            for i in range(context_size)
+        ]
+    return binding
+
+
+def _keymap_text(bindings):
+    # Comments and trailing commas exercise the tolerant parsing paths
+    lines = ["// Synthetic keymap", "["]
+    for binding in bindings:
+        lines.append("    %s," % json.dumps(binding))
+    lines.append("]")
+    return "\n".join(lines)
+
+
+def generate_corpus(root, config):
+    """
+    Generate a synthetic install below root. Returns a dictionary with the
+    paths to use for the host and statistics about the corpus.
+    """
+    rng = random.Random(config["seed"])
+    packages_path = os.path.join(root, "Packages")
+    installed_packages_path = os.path.join(root, "Installed Packages")
+    executable_path = os.path.join(root, "bin", "sublime_text")
+    shipped_packages_path = os.path.join(root, "bin", "Packages")
+    for path in (packages_path, installed_packages_path, shipped_packages_path):
+        os.makedirs(path)
+
+    package_names = ["Default", "User"] + [
+        "Package%04d" % i for i in range(max(config["packages"] - 2, 0))]
+    package_names = package_names[:config["packages"]]
+    per_package = max(config["bindings"] // max(len(package_names), 1), 1)
+    platform_keymap = "Default (%s).sublime-keymap" % config["platform_name"]
+
+    chord_pool = []
+    stats = {"packages": len(package_names), "archives": 0, "keymap_files": 0,
+             "bindings": 0, "bytes": 0}
+    for index, package in enumerate(package_names):
+        base_count = per_package * 3 // 4
+        files = {
+            "Default.sublime-keymap": [_random_binding(rng, config, chord_pool) for i in range(base_count)],
+            platform_keymap: [_random_binding(rng, config, chord_pool) for i in range(per_package - base_count)],
+            "README.md": None,
+            "src/module.py": None
+        }
+        zipped = package not in ("Default", "User") and rng.random() < config["zip_ratio"]
+        if zipped:
+            directory = installed_packages_path
+            if index % 2:
+                directory = shipped_packages_path
+            with zipfile.ZipFile(os.path.join(directory, package + ".sublime-package"), "w") as zip_file:
+                for name, bindings in files.items():
+                    content = "# placeholder" if bindings is None else _keymap_text(bindings)
+                    zip_file.writestr(name, content)
+            stats["archives"] += 1
+        else:
+            for name, bindings in files.items():
+                path = os.path.join(packages_path, package, name)
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                content = "# placeholder" if bindings is None else _keymap_text(bindings)
+                with open(path, "w") as file_obj:
+                    file_obj.write(content)
+
+        for name, bindings in files.items():
+            if bindings is not None:
+                stats["keymap_files"] += 1
+                stats["bindings"] += len(bindings)
+                stats["bytes"] += len(_keymap_text(bindings))
+
+    return {
+        "packages_path": packages_path,
+        "installed_packages_path": installed_packages_path,
+        "executable_path": executable_path,
+        "stats": stats
+    }
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.stages = {}
+
+    def time(self, stage, function):
+        start = time.time()
+        result = function()
+        self.stages.setdefault(stage, []).append(time.time() - start)
+        return result
+
+    def results(self):
+        results = {}
+        for stage, runs in self.stages.items():
+            results[stage] = {"best": min(runs), "mean": sum(runs) / len(runs),
+                              "runs": runs}
+        return results
+
+
+def clear_memos(package_resources):
+    """
+    Clear the module level memos, so a stage does not run on the memos
+    warmed by the stages before it.
+    """
+    package_resources._zip_index.clear()
+    chords.clear_memo()
+
+
+def run_stages(engine, package_resources, timer, config):
+    """
+    Run each stage of a scan once, recording its time. Stages that parse
+    chords or read archives start from cold memos.
+    """
+    settings = engine.sublime.load_settings(engine.SETTINGS_FILE)
+    packages = package_resources.get_packages_list()
+    platform_keymap = "default (%s).sublime-keymap" % engine.PLATFORM.lower()
+
+    def list_files():
+        keymap_files = []
+        for package in packages:
+            for filename in package_resources.list_package_files(package):
+                if filename.lower().endswith(("default.sublime-keymap", platform_keymap)):
+                    keymap_files.append((package, filename))
+        return keymap_files
+    keymap_files = timer.time("list_package_files", list_files)
+
+    def get_resources():
+        return [(package, package_resources.get_resource(package, filename))
+                for package, filename in keymap_files]
+    contents = timer.time("get_resource", get_resources)
+
+    def parse():
+        return [(package, engine.sublime.decode_value(content))
+                for package, content in contents]
+    key_maps = timer.time("parse", parse)
+
+    thread = engine.FindKeyConflictsCall(settings, list(packages))
+    thread.keymap_cache = None
+
+    chords.clear_memo()
+
+    def order_keys():
+        for package, key_map in key_maps:
+            for entry in key_map:
+                for key in entry["keys"]:
+                    thread.order_key_string(key)
+    timer.time("order_key_string", order_keys)
+
+    chords.clear_memo()
+
+    def handle_key_maps():
+        for package, key_map in key_maps:
+            thread.handle_key_map(package, key_map)
+        return thread.all_key_map
+    all_key_map = timer.time("handle_key_map", handle_key_maps)
+
+    conflicts = timer.time("remove_non_conflicts",
+                           lambda: engine.remove_non_conflicts(all_key_map, True))
+    overlaps = timer.time("find_overlap_conflicts",
+                          lambda: engine.find_overlap_conflicts(all_key_map))
+
+    def render():
+        output = engine.GenerateText(all_key_map, False)
+        size = 0
+        for chunk in output.generate_overlapping_key_text(overlaps):
+            size += len(chunk)
+        for chunk in output.generate_key_map_text(conflicts):
+            size += len(chunk)
+        return size
+    timer.time("GenerateOutput", render)
+
+    def full_scan():
+        scan = engine.FindKeyConflictsCall(settings, list(packages))
+        scan.keymap_cache = None
+        scan.run()
+        return scan.all_key_map
+    clear_memos(package_resources)
+    timer.time("full_scan", full_scan)
+
+    if config["processes"] > 1:
+        def full_scan_processes():
+            settings.set("scan_processes", config["processes"])
+            try:
+                return full_scan()
+            finally:
+                settings.set("scan_processes", 0)
+        clear_memos(package_resources)
+        timer.time("full_scan_processes", full_scan_processes)
+
+    return {"keys": len(all_key_map), "direct_conflicts": len(conflicts),
+            "overlap_conflicts": len(overlaps)}
+
+
+def run_benchmark(config):
+    """
+    Generate a corpus for the configuration and time every stage.
+    """
+    root = tempfile.mkdtemp(prefix="fkc-benchmark-")
+    try:
+        corpus = generate_corpus(root, config)
+        host = StubHost(corpus["packages_path"],
+                        installed_packages_path=corpus["installed_packages_path"],
+                        executable_path=corpus["executable_path"],
+                        platform=config["platform"], version=config["build"])
+        set_host(host)
+        engine, package_resources = _load_engine()
+
+        timer = StageTimer()
+        counts = None
+        for i in range(config["repeat"]):
+            # Start each run from cold in-process caches
+            clear_memos(package_resources)
+            counts = run_stages(engine, package_resources, timer, config)
+
+        return {"config": config, "corpus": corpus["stats"], "results": counts,
+                "stages": timer.results()}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _load_engine():
+    # Modules bind the host when imported, so import them again for
+    # every corpus.
+    for name in list(sys.modules.keys()):
+        if name.startswith(__package__ + ".") and name.rsplit(".", 1)[-1] in (
+                "engine", "package_resources", "keymap_cache"):
+            del sys.modules[name]
+    from . import engine
+    from . import package_resources
+    return engine, package_resources
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Benchmark FindKeyConflicts scanning stages.")
+    parser.add_argument("--preset", action="append", choices=sorted(PRESETS.keys()),
+                        help="configuration preset, may be repeated (default: small, medium)")
+    parser.add_argument("--packages", type=int, help="number of packages")
+    parser.add_argument("--bindings", type=int, help="total number of bindings")
+    parser.add_argument("--chord-length", type=int, default=3,
+                        help="maximum number of chords in a key sequence (default: 3)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2,
+                        help="probability a binding reuses an existing key sequence (default: 0.2)")
+    parser.add_argument("--context-size", type=int, default=3,
+                        help="maximum number of context entries per binding (default: 3)")
+    parser.add_argument("--zip-ratio", type=float, default=0.5,
+                        help="fraction of packages stored as archives (default: 0.5)")
+    parser.add_argument("--platform", default="linux", choices=("linux", "windows", "osx"))
+    parser.add_argument("--build", default="3211", help="Sublime Text build to emulate")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="also time a full scan parsing in this many worker processes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to a file")
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    sizes = []
+    if args.packages is not None or args.bindings is not None:
+        sizes.append({"packages": args.packages or 100, "bindings": args.bindings or 10000})
+    for preset in args.preset or ([] if sizes else ["small", "medium"]):
+        sizes.append(PRESETS[preset])
+
+    results = []
+    for size in sizes:
+        config = {
+            "packages": size["packages"],
+            "bindings": size["bindings"],
+            "chord_length": args.chord_length,
+            "duplicate_rate": args.duplicate_rate,
+            "context_size": args.context_size,
+            "zip_ratio": args.zip_ratio,
+            "platform": args.platform,
+            "platform_name": {"linux": "Linux", "windows": "Windows", "osx": "OSX"}[args.platform],
+            "build": args.build,
+            "processes": args.processes,
+            "repeat": args.repeat,
+            "seed": args.seed
+        }
+        results.append(run_benchmark(config))
+
+    report = {"python": platform.python_version(), "platform": sys.platform,
+              "benchmarks": results}
+    content = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is not None:
+        with open(args.output, "w") as file_obj:
+            file_obj.write(content + "\n")
+    else:
+        sys.stdout.write(content + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
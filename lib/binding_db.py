@@ -0,0 +1,225 @@
+"""
+SQLite database of collected key bindings.
+
+The bindings of a scan can be written to a database file, indexed by key
+string, command and package, so audits can query them without scanning the
+packages again. Key strings are stored in their canonical form, so a range
+over the key string index also finds every binding starting with a chord
+prefix. This module does not access the host.
+
+Queries are written as whitespace separated "field:value" terms:
+
+    keys:ctrl+k,ctrl+b    bindings of a key (a bare key string does the same)
+    keys:ctrl+k,*         bindings starting with ctrl+k
+    command:NAME          bindings running the command
+    package:NAME          bindings of the package
+    min_bindings:N        list the packages with at least N matching
+                          bindings instead of the bindings
+"""
+import json
+
+try:
+    import sqlite3
+except ImportError:
+    # Not shipped with the Python of every Sublime Text build
+    sqlite3 = None
+
+from .chords import parse_key_sequence, split_key_sequence
+
+__all__ = [
+    "DATABASE_FORMAT",
+    "BindingDatabase",
+    "Query",
+    "parse_query"
+]
+
+DATABASE_FORMAT = 1
+WILDCARD = "*"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS bindings ("
+    "id INTEGER PRIMARY KEY, keys TEXT NOT NULL, package TEXT NOT NULL, "
+    "command TEXT, args TEXT, context TEXT)",
+    "CREATE INDEX IF NOT EXISTS bindings_keys ON bindings (keys)",
+    "CREATE INDEX IF NOT EXISTS bindings_command ON bindings (command)",
+    "CREATE INDEX IF NOT EXISTS bindings_package ON bindings (package)"
+]
+
+
+class Query(object):
+    """
+    Parsed query. keys is a canonical key string, matched exactly unless
+    prefix is set, in which case it matches the bindings extending it.
+    """
+    def __init__(self):
+        self.keys = None
+        self.prefix = False
+        self.command = None
+        self.package = None
+        self.min_bindings = None
+
+
+def parse_query(text):
+    """
+    Return the Query for a query string. Raises ValueError for unknown
+    fields or invalid values.
+    """
+    query = Query()
+    for term in text.split():
+        field, separator, value = term.partition(":")
+        if not separator:
+            field, value = "keys", term
+        if not value:
+            raise ValueError("Missing value for '%s'" % field)
+
+        if field == "keys":
+            keys = split_key_sequence(value)
+            if keys and keys[-1] == WILDCARD:
+                keys = keys[:-1]
+                query.prefix = True
+            if keys:
+                query.keys = parse_key_sequence(keys)[1]
+        elif field == "command":
+            query.command = value
+        elif field == "package":
+            query.package = value
+        elif field == "min_bindings":
+            try:
+                query.min_bindings = int(value)
+            except ValueError:
+                raise ValueError("min_bindings must be a number")
+        else:
+            raise ValueError("Unknown query field '%s'" % field)
+    return query
+
+
+def _where_clause(query):
+    conditions = []
+    parameters = []
+    if query.keys is not None and query.prefix:
+        # "," sorts directly before "-", so this range holds every key
+        # string extending the prefix
+        conditions.append("keys >= ? AND keys < ?")
+        parameters.extend([query.keys + ",", query.keys + "-"])
+    elif query.keys is not None:
+        conditions.append("keys = ?")
+        parameters.append(query.keys)
+    if query.command is not None:
+        conditions.append("command = ?")
+        parameters.append(query.command)
+    if query.package is not None:
+        conditions.append("package = ?")
+        parameters.append(query.package)
+
+    if not conditions:
+        return "", parameters
+    return " WHERE " + " AND ".join(conditions), parameters
+
+
+def _encode(value):
+    if value is None:
+        return None
+    return json.dumps(value, sort_keys=True)
+
+
+class BindingDatabase(object):
+    """
+    Connection to a binding database. Connections can only be used by the
+    thread that opened them.
+    """
+    def __init__(self, path):
+        if sqlite3 is None:
+            raise RuntimeError("The sqlite3 module is not available")
+        self.connection = sqlite3.connect(path)
+        if self.get_metadata("format") not in (None, str(DATABASE_FORMAT)):
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS bindings")
+                self.connection.execute("DROP TABLE IF EXISTS metadata")
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            self.set_metadata("format", str(DATABASE_FORMAT))
+
+    def close(self):
+        self.connection.close()
+
+    def get_metadata(self, name):
+        try:
+            row = self.connection.execute(
+                "SELECT value FROM metadata WHERE name = ?", (name,)).fetchone()
+        except sqlite3.OperationalError:
+            # The table does not exist yet
+            return None
+        return row[0] if row is not None else None
+
+    def set_metadata(self, name, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", (name, value))
+
+    def write(self, all_key_map, created):
+        """
+        Replace the bindings in the database with those of the key map.
+        created identifies the key map, see get_created.
+        """
+        def rows():
+            for key_string in sorted(all_key_map):
+                bucket = all_key_map[key_string]
+                for package in bucket["packages"]:
+                    for entry in bucket[package]:
+                        yield (key_string, package, entry.get("command"),
+                               _encode(entry.get("args")), _encode(entry.get("context")))
+
+        with self.connection:
+            self.connection.execute("DELETE FROM bindings")
+            self.connection.executemany(
+                "INSERT INTO bindings (keys, package, command, args, context) "
+                "VALUES (?, ?, ?, ?, ?)", rows())
+            self.set_metadata("created", repr(created))
+
+    def get_created(self):
+        """
+        Return the created value of the last write, or None.
+        """
+        created = self.get_metadata("created")
+        return float(created) if created is not None else None
+
+    def find_bindings(self, query):
+        """
+        Return the bindings matching the query as a key map, with buckets
+        like those of the scanned key map.
+        """
+        where, parameters = _where_clause(query)
+        cursor = self.connection.execute(
+            "SELECT keys, package, command, args, context FROM bindings" + where +
+            " ORDER BY keys, id", parameters)
+
+        key_map = {}
+        for key_string, package, command, args, context in cursor:
+            entry = {}
+            if command is not None:
+                entry["command"] = command
+            if args is not None:
+                entry["args"] = json.loads(args)
+            if context is not None:
+                entry["context"] = json.loads(context)
+
+            bucket = key_map.get(key_string)
+            if bucket is None:
+                bucket = key_map[key_string] = {"packages": []}
+            if package not in bucket:
+                bucket["packages"].append(package)
+                bucket[package] = []
+            bucket[package].append(entry)
+        return key_map
+
+    def count_package_bindings(self, query):
+        """
+        Return a list of (package, count) tuples for the packages with at
+        least query.min_bindings matching bindings, most bindings first.
+        """
+        where, parameters = _where_clause(query)
+        return self.connection.execute(
+            "SELECT package, COUNT(*) FROM bindings" + where +
+            " GROUP BY package HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC, package",
+            parameters + [query.min_bindings or 0]).fetchall()
@@ -0,0 +1,181 @@
+"""
+Compact storage for key bindings.
+
+Bindings are stored as __slots__ records instead of the parsed dictionaries.
+Command names and the strings in context and args values are interned, and
+packages are referenced through an id table. Records and buckets support
+the mapping operations the output code relies on, so they can be used in
+place of the dictionaries they replace.
+"""
+import sys
+import threading
+
+__all__ = [
+    "Binding",
+    "KeyBucket",
+    "BindingStore",
+    "binding_store"
+]
+
+try:
+    intern_string = sys.intern
+except AttributeError:
+    intern_string = intern
+
+STRING_TYPE = type("")
+
+
+def intern_leaves(mapping):
+    """
+    Replace the string values of a dictionary by interned equal strings.
+    """
+    for key, item in mapping.items():
+        if item.__class__ is STRING_TYPE:
+            mapping[key] = intern_string(item)
+
+
+class Binding(object):
+    """
+    A single key binding. Supports read only mapping access to the keys,
+    command, args and context fields of the original keymap entry.
+    """
+    __slots__ = ("chords", "command", "args", "context", "package_id")
+
+    FIELDS = ("keys", "command", "args", "context")
+
+    def __init__(self, chords, command, args, context, package_id):
+        self.chords = chords
+        self.command = command
+        self.args = args
+        self.context = context
+        self.package_id = package_id
+
+    @property
+    def package(self):
+        return binding_store.package_name(self.package_id)
+
+    def get(self, field, default=None):
+        if field == "keys":
+            return [chord.text for chord in self.chords]
+        if field in Binding.FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                return value
+        return default
+
+    def __getitem__(self, field):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def keys(self):
+        return [field for field in Binding.FIELDS if field in self]
+
+    def to_dict(self):
+        entry = {}
+        for field in self.keys():
+            entry[field] = self.get(field)
+        return entry
+
+    def __repr__(self):
+        return "Binding(%r)" % self.to_dict()
+
+
+class KeyBucket(object):
+    """
+    The bindings of one key string, grouped by package in precedence
+    order. bucket["packages"] is the list of packages and bucket[package]
+    the list of bindings for that package.
+    """
+    __slots__ = ("packages", "entries")
+
+    def __init__(self, packages=None, entries=None):
+        self.packages = packages or []
+        self.entries = entries or []
+
+    def add(self, package, binding):
+        try:
+            self.entries[self.packages.index(package)].append(binding)
+        except ValueError:
+            self.packages.append(package)
+            self.entries.append([binding])
+
+    def get(self, key, default=None):
+        if key == "packages":
+            return self.packages
+        try:
+            return self.entries[self.packages.index(key)]
+        except ValueError:
+            return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key == "packages" or key in self.packages
+
+    def keys(self):
+        return ["packages"] + self.packages
+
+    def to_dict(self):
+        bucket = {"packages": list(self.packages)}
+        for package, bindings in zip(self.packages, self.entries):
+            bucket[package] = [binding.to_dict() for binding in bindings]
+        return bucket
+
+
+class BindingStore(object):
+    """
+    Intern tables shared by all bindings.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.package_ids = {}
+        self.package_names = []
+
+    def package_id(self, package):
+        package_id = self.package_ids.get(package)
+        if package_id is None:
+            with self.lock:
+                package_id = self.package_ids.get(package)
+                if package_id is None:
+                    package_id = len(self.package_names)
+                    self.package_names.append(package)
+                    self.package_ids[package] = package_id
+        return package_id
+
+    def package_name(self, package_id):
+        return self.package_names[package_id]
+
+    def share_value(self, value):
+        """
+        Intern the strings of an args or context value in place, so the
+        operands repeated across bindings are only stored once. Values
+        are treated as read only afterwards.
+        """
+        if value.__class__ is list:
+            for item in value:
+                if item.__class__ is dict:
+                    intern_leaves(item)
+        elif value.__class__ is dict:
+            intern_leaves(value)
+        return value
+
+    def create_binding(self, package, entry, chords):
+        command = entry.get("command")
+        if isinstance(command, type("")):
+            command = intern_string(command)
+        return Binding(chords, command,
+                       self.share_value(entry.get("args")),
+                       self.share_value(entry.get("context")),
+                       self.package_id(package))
+
+
+binding_store = BindingStore()
@@ -0,0 +1,167 @@
+"""
+Canonical representation of key chords.
+
+A chord such as "shift+ctrl+p" is parsed once into a Chord holding a
+modifier bitmask and an interned key id. Parsing is memoized, so the many
+identical chords found across packages share one Chord object, and the
+canonical key string ("ctrl+shift+p") is only built once.
+"""
+import threading
+
+__all__ = [
+    "MODIFIERS",
+    "MODIFIER_BITS",
+    "Chord",
+    "parse_chord",
+    "parse_key_sequence",
+    "split_key_sequence",
+    "normalize_key_string",
+    "clear_memo"
+]
+
+MODIFIERS = ('shift', 'ctrl', 'alt', 'super')
+MODIFIER_BITS = {"shift": 1, "ctrl": 2, "alt": 4, "super": 8}
+
+# Memo tables are cleared once they hold this many entries
+MEMO_SIZE = 16384
+
+# Key ids identify chords, so unlike the memo tables this is never cleared
+_key_ids = {}
+_chord_memo = {}
+_sequence_memo = {}
+_lock = threading.Lock()
+
+
+class Chord(object):
+    """
+    A single normalized chord.
+
+    modifiers   Bitmask of the modifiers, see MODIFIER_BITS.
+    key_id      Interned id of the non modifier keys.
+    text        Canonical key string, as shown in the output.
+    """
+    __slots__ = ("modifiers", "key_id", "text", "part_count")
+
+    def __init__(self, modifiers, key_id, text, part_count):
+        self.modifiers = modifiers
+        self.key_id = key_id
+        self.text = text
+        self.part_count = part_count
+
+    def is_single_key(self):
+        """
+        True if the chord consists of a single key without modifiers.
+        """
+        return self.part_count == 1
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, Chord) and
+                                 self.key_id == other.key_id and
+                                 self.modifiers == other.modifiers)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return self.key_id << 4 | self.modifiers
+
+    def __repr__(self):
+        return "Chord(%r)" % self.text
+
+
+def _split_chord(key_string):
+    split_keys = key_string.split("+")
+    try:
+        i = split_keys.index("")
+        split_keys[i] = "+"
+        split_keys.remove("")
+    except:
+        pass
+    return split_keys
+
+
+def _create_chord(key_string):
+    modifiers = []
+    keys = []
+    for key in _split_chord(key_string):
+        if key in MODIFIER_BITS:
+            modifiers.append(key)
+        else:
+            keys.append(key)
+    modifiers.sort()
+    keys.sort()
+
+    mask = 0
+    for modifier in modifiers:
+        mask |= MODIFIER_BITS[modifier]
+    key_text = "+".join(keys)
+    key_id = _key_ids.get(key_text)
+    if key_id is None:
+        key_id = _key_ids.setdefault(key_text, len(_key_ids))
+
+    text = "+".join(modifiers + keys)
+    return Chord(mask, key_id, text, len(modifiers) + len(keys))
+
+
+def parse_chord(key_string):
+    """
+    Return the Chord for a key string such as "shift+ctrl+p".
+    """
+    chord = _chord_memo.get(key_string)
+    if chord is None:
+        chord = _create_chord(key_string)
+        with _lock:
+            if len(_chord_memo) >= MEMO_SIZE:
+                _chord_memo.clear()
+            # Another thread may have parsed the same chord meanwhile
+            chord = _chord_memo.setdefault(key_string, chord)
+            if chord.text not in _chord_memo:
+                _chord_memo[chord.text] = chord
+    return chord
+
+
+def parse_key_sequence(keys):
+    """
+    Return (chords, key_string) for a list of key strings, where chords is
+    a tuple of Chord objects and key_string the canonical comma separated
+    key string used for display.
+    """
+    memo_key = tuple(keys)
+    result = _sequence_memo.get(memo_key)
+    if result is None:
+        chords = tuple(parse_chord(key) for key in keys)
+        result = (chords, ",".join([chord.text for chord in chords]))
+        with _lock:
+            if len(_sequence_memo) >= MEMO_SIZE:
+                _sequence_memo.clear()
+            result = _sequence_memo.setdefault(memo_key, result)
+    return result
+
+
+def split_key_sequence(key_string):
+    """
+    Split a comma separated key string, such as "ctrl+k,ctrl+,", into
+    the key strings of its chords. A comma directly following a "+" or
+    starting a chord is the comma key rather than a separator.
+    """
+    keys = []
+    current = ""
+    for character in key_string:
+        if character == "," and current and not current.endswith("+"):
+            keys.append(current)
+            current = ""
+        else:
+            current += character
+    if current:
+        keys.append(current)
+    return keys
+
+
+def normalize_key_string(key_string):
+    return parse_chord(key_string).text
+
+
+def clear_memo():
+    with _lock:
+        _chord_memo.clear()
+        _sequence_memo.clear()
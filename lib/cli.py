@@ -0,0 +1,250 @@
+"""
+Command line entry point generating the conflict reports outside of the
+editor, against packages directories on disk.
+
+Usage:
+    python -m lib.cli --packages PATH [options] [conflicts|all|overlaps|mappings]
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+
+from .host import set_host
+from .stub_host import StubHost
+from .profiler import NullProfiler
+from .binding_db import BindingDatabase
+from .export import EXPORT_FORMATS, iter_binding_records, iter_overlap_records, write_records, open_export_file
+
+__all__ = [
+    "main"
+]
+
+REPORTS = ("conflicts", "all", "overlaps", "mappings")
+
+
+def default_platform():
+    if sys.platform == "darwin":
+        return "osx"
+    if sys.platform.startswith("win"):
+        return "windows"
+    return "linux"
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Report key binding conflicts between Sublime Text packages.")
+    parser.add_argument("report", nargs="?", default="all", choices=REPORTS,
+                        help="report to generate (default: all)")
+    parser.add_argument("--packages", required=True,
+                        help="Packages directory containing loose packages")
+    parser.add_argument("--installed-packages",
+                        help="directory containing installed .sublime-package files")
+    parser.add_argument("--executable",
+                        help="path of the Sublime Text executable; shipped "
+                             "packages are read from the Packages folder next to it")
+    parser.add_argument("--platform", default=default_platform(),
+                        choices=("linux", "windows", "osx"))
+    parser.add_argument("--all-platforms", action="store_true",
+                        help="report on the keymaps of every platform in one "
+                             "scan, followed by the conflicts unique to one "
+                             "platform (text format only)")
+    parser.add_argument("--build", default="3211",
+                        help="Sublime Text build to emulate (default: 3211)")
+    parser.add_argument("--processes", type=int,
+                        help="number of worker processes parsing keymaps "
+                             "(default: the scan_processes setting)")
+    parser.add_argument("--cache-dir",
+                        help="directory used to cache parsed keymaps")
+    parser.add_argument("--format", default="text", choices=("text",) + EXPORT_FORMATS,
+                        help="report format; jsonl and csv write one record "
+                             "per binding (default: text)")
+    parser.add_argument("--output", help="write the report to a file")
+    parser.add_argument("--database",
+                        help="also write the collected bindings to this SQLite "
+                             "file, to be queried with lib.query")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a per phase profile of the run to stderr")
+    return parser
+
+
+def create_host(args):
+    return StubHost(args.packages,
+                    installed_packages_path=args.installed_packages,
+                    executable_path=args.executable,
+                    platform=args.platform,
+                    version=args.build,
+                    cache_path=args.cache_dir)
+
+
+def generate_report(report, settings, all_key_map, engine, profiler=None):
+    """
+    Generator yielding the text of the specified report.
+    """
+    if profiler is None:
+        profiler = NullProfiler()
+    return itertools.chain(*report_chunks(report, settings, all_key_map, engine, profiler)[0])
+
+
+def generate_platform_report(report, settings, platform_key_maps, engine, profiler=None):
+    """
+    Generator yielding the text of the specified report for every platform,
+    followed by the direct conflicts unique to one platform.
+    """
+    if profiler is None:
+        profiler = NullProfiler()
+
+    chunks = []
+    platform_conflicts = {}
+    for platform in engine.PLATFORMS:
+        all_key_map = platform_key_maps[platform]
+        output = engine.GenerateText(all_key_map, settings.get("show_args", False))
+        chunks.append([output.generate_header("%s Key Bindings" % platform)])
+        platform_chunks, new_key_map = report_chunks(report, settings, all_key_map, engine, profiler)
+        chunks.extend(platform_chunks)
+        if new_key_map is not None:
+            platform_conflicts[platform] = new_key_map
+
+    if platform_conflicts:
+        unique_conflicts = engine.find_unique_conflicts(platform_conflicts)
+        for platform in engine.PLATFORMS:
+            chunks.append([output.generate_header("Key Conflicts Only On %s" % platform)])
+            chunks.append(output.generate_key_map_text(unique_conflicts[platform]))
+
+    return itertools.chain(*chunks)
+
+
+def report_chunks(report, settings, all_key_map, engine, profiler):
+    """
+    Return (chunks, conflicts), where chunks is a list of iterables of the
+    report text and conflicts the direct conflicts if the report includes
+    them, or None.
+    """
+    output = engine.GenerateText(all_key_map, settings.get("show_args", False))
+
+    chunks = []
+    new_key_map = None
+    if report in ("all", "overlaps"):
+        overlapping_conflicts_map = find_overlaps(settings, all_key_map, engine, profiler)
+        chunks.append([output.generate_header("Multi Part Key Conflicts")])
+        chunks.append(output.generate_overlapping_key_text(overlapping_conflicts_map))
+    if report in ("all", "conflicts"):
+        new_key_map = find_conflicts(settings, all_key_map, engine, profiler)
+        chunks.append([output.generate_header("Key Conflicts (Only direct conflicts)")])
+        chunks.append(output.generate_key_map_text(new_key_map))
+    if report == "mappings":
+        chunks.append([output.generate_header("All Key Mappings")])
+        chunks.append(output.generate_key_map_text(remove_ignored_keys(settings, all_key_map, engine)))
+
+    return chunks, new_key_map
+
+
+def generate_records(report, settings, all_key_map, engine, profiler=None):
+    """
+    Generator yielding the export records of the specified report.
+    """
+    if profiler is None:
+        profiler = NullProfiler()
+
+    records = []
+    if report in ("all", "overlaps"):
+        overlapping_conflicts_map = find_overlaps(settings, all_key_map, engine, profiler)
+        records.append(iter_overlap_records(all_key_map, overlapping_conflicts_map))
+    if report in ("all", "conflicts"):
+        new_key_map = find_conflicts(settings, all_key_map, engine, profiler)
+        records.append(iter_binding_records(new_key_map, "direct"))
+    if report == "mappings":
+        records.append(iter_binding_records(remove_ignored_keys(settings, all_key_map, engine)))
+
+    return itertools.chain(*records)
+
+
+def remove_ignored_keys(settings, all_key_map, engine):
+    return engine.remove_ignored_keys(all_key_map,
+                                      settings.get("ignore_single_key", False),
+                                      settings.get("ignore_patterns", []))
+
+
+def find_overlaps(settings, all_key_map, engine, profiler):
+    all_key_map = remove_ignored_keys(settings, all_key_map, engine)
+    with profiler.time("find_overlap_conflicts"):
+        return engine.find_overlap_conflicts(all_key_map)
+
+
+def find_conflicts(settings, all_key_map, engine, profiler):
+    all_key_map = remove_ignored_keys(settings, all_key_map, engine)
+    with profiler.time("remove_non_conflicts"):
+        return engine.remove_non_conflicts(all_key_map,
+                                           settings.get("display_internal_conflicts", True),
+                                           settings.get("context_aware_conflicts", False))
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    if not os.path.isdir(args.packages):
+        sys.stderr.write("Packages directory '%s' does not exist\n" % args.packages)
+        return 2
+    if args.all_platforms and args.format != "text":
+        sys.stderr.write("--all-platforms only supports the text format\n")
+        return 2
+
+    # The host must be installed before the engine is imported
+    set_host(create_host(args))
+    from . import engine
+
+    settings = engine.sublime.load_settings(engine.SETTINGS_FILE)
+    if args.profile:
+        settings.set("profile", True)
+    if args.processes is not None:
+        settings.set("scan_processes", args.processes)
+    if args.all_platforms:
+        thread = engine.MultiPlatformCall(settings, engine.get_packages_list())
+    else:
+        thread = engine.FindKeyConflictsCall(settings, engine.get_packages_list())
+    thread.run()
+    if thread.failed:
+        sys.stderr.write("The scan failed, see the log for details\n")
+        return 1
+
+    stream = sys.stdout
+    if args.output is not None and args.format == "text":
+        stream = open(args.output, "w")
+    elif args.output is not None:
+        stream = open_export_file(args.output, args.format)
+    try:
+        with thread.profiler.time("render") as timer:
+            if args.all_platforms:
+                for chunk in generate_platform_report(args.report, settings, thread.platform_key_maps,
+                                                      engine, thread.profiler):
+                    stream.write(chunk)
+                    timer.size += len(chunk)
+            elif args.format == "text":
+                for chunk in generate_report(args.report, settings, thread.all_key_map,
+                                             engine, thread.profiler):
+                    stream.write(chunk)
+                    timer.size += len(chunk)
+            else:
+                timer.calls = write_records(
+                    generate_records(args.report, settings, thread.all_key_map,
+                                     engine, thread.profiler),
+                    stream, args.format)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    if args.database is not None:
+        database = BindingDatabase(args.database)
+        try:
+            with thread.profiler.time("write_database"):
+                database.write(thread.all_key_map, time.time())
+        finally:
+            database.close()
+
+    if thread.profiler.enabled:
+        sys.stderr.write(thread.profiler.generate_report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
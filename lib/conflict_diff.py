@@ -0,0 +1,108 @@
+"""
+Differences in conflicts between two states of the key bindings.
+
+Only the keys bound by the packages that changed between the two states
+can gain or lose conflicts, so only those keys, and the keys they extend,
+are compared.
+"""
+from .engine import find_key_conflict, find_key_overlaps, get_package_keys, get_sorted_keys
+
+__all__ = [
+    "ConflictDiff",
+    "diff_conflicts"
+]
+
+
+class ConflictDiff(object):
+    """
+    Added, removed and changed conflicts. Direct conflicts map key strings
+    to buckets, and overlap conflicts map key strings to the key strings
+    they are a prefix of, like remove_non_conflicts and
+    find_overlap_conflicts. Removed entries refer to the old key map, the
+    others to the new one.
+    """
+    def __init__(self):
+        self.added_conflicts = {}
+        self.removed_conflicts = {}
+        self.changed_conflicts = {}
+        self.added_overlaps = {}
+        self.removed_overlaps = {}
+        self.changed_overlaps = {}
+
+    def is_empty(self):
+        return not (self.added_conflicts or self.removed_conflicts or
+                    self.changed_conflicts or self.added_overlaps or
+                    self.removed_overlaps or self.changed_overlaps)
+
+
+def _affected_keys(old_key_map, new_key_map, packages):
+    if packages is None:
+        return set(old_key_map) | set(new_key_map)
+
+    keys = set()
+    for key_map in (old_key_map, new_key_map):
+        package_keys = get_package_keys(key_map)
+        for package in packages:
+            keys.update(package_keys.get(package, []))
+    return keys
+
+
+def _bucket_value(bucket):
+    return bucket.to_dict() if hasattr(bucket, "to_dict") else bucket
+
+
+def diff_conflicts(old_key_map, new_key_map, packages, display_internal_conflicts, context_aware=False):
+    """
+    Return a ConflictDiff between two key maps.
+
+    Arguments:
+    packages    The packages whose bindings may differ between the key
+                maps, or None to compare every key.
+    """
+    diff = ConflictDiff()
+    keys = _affected_keys(old_key_map, new_key_map, packages)
+
+    base_keys = set()
+    for key in keys:
+        old_bucket = None
+        if key in old_key_map:
+            old_bucket = find_key_conflict(old_key_map[key], display_internal_conflicts, context_aware)
+        new_bucket = None
+        if key in new_key_map:
+            new_bucket = find_key_conflict(new_key_map[key], display_internal_conflicts, context_aware)
+
+        if old_bucket is None and new_bucket is not None:
+            diff.added_conflicts[key] = new_bucket
+        elif old_bucket is not None and new_bucket is None:
+            diff.removed_conflicts[key] = old_bucket
+        elif old_bucket is not None and _bucket_value(old_bucket) != _bucket_value(new_bucket):
+            diff.changed_conflicts[key] = new_bucket
+
+        # Overlaps of the key itself, and of the keys it extends
+        base_keys.add(key)
+        for index, character in enumerate(key):
+            if character == ",":
+                base_keys.add(key[:index])
+
+    def bindings_changed(key):
+        return key in keys and _bucket_value(old_key_map[key]) != _bucket_value(new_key_map[key])
+
+    old_keylist = get_sorted_keys(old_key_map)
+    new_keylist = get_sorted_keys(new_key_map)
+    for base_key in base_keys:
+        old_overlaps = []
+        if base_key in old_key_map:
+            old_overlaps = find_key_overlaps(base_key, old_keylist)
+        new_overlaps = []
+        if base_key in new_key_map:
+            new_overlaps = find_key_overlaps(base_key, new_keylist)
+
+        if not old_overlaps and new_overlaps:
+            diff.added_overlaps[base_key] = new_overlaps
+        elif old_overlaps and not new_overlaps:
+            diff.removed_overlaps[base_key] = old_overlaps
+        elif old_overlaps and (old_overlaps != new_overlaps or bindings_changed(base_key) or
+                               [key for key in new_overlaps if bindings_changed(key)]):
+            diff.changed_overlaps[base_key] = new_overlaps
+
+    return diff
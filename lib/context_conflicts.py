@@ -0,0 +1,177 @@
+"""
+Context aware conflict evaluation.
+
+Two bindings on the same key only conflict if their contexts can be true at
+the same time. Bindings are grouped by the signature of their context
+constraints, and for every signature the provably disjoint signatures are
+found through an index keyed by context key and operand, rather than by
+comparing every pair of bindings.
+
+A pair of contexts is only considered disjoint when they require different
+values for the same view level key (for example "setting.x" equal to true
+and to false, or different "num_selections"), or when one requires a value
+the other excludes through "not_equal". Keys checked per selection, such as
+"selection_empty", only count if at least one of the rules sets
+"match_all", as different selections can otherwise satisfy both. Scope
+selectors are never considered disjoint, as they match anywhere in the
+scope stack and scopes nest. Anything else is assumed to overlap.
+"""
+import json
+
+__all__ = [
+    "context_signature",
+    "find_overlapping_bindings"
+]
+
+# Context keys with a single value per view
+VIEW_KEYS = frozenset([
+    "auto_complete_visible", "has_next_field", "has_prev_field",
+    "num_selections", "overlay_visible", "panel_visible",
+    "panel_has_focus", "panel"
+])
+
+# Context keys evaluated for every selection
+SELECTION_KEYS = frozenset([
+    "selection_empty", "preceding_text", "following_text", "text"
+])
+
+
+def _operand_key(operand):
+    return json.dumps(operand, sort_keys=True)
+
+
+def _constraint_key(rule):
+    """
+    Return the index key of a context rule, or None if the rule can not
+    make two contexts disjoint. Rules on keys checked per selection are
+    keyed by (key, match_all).
+    """
+    key = rule["key"]
+    if not hasattr(key, "startswith"):
+        return None
+    if key in VIEW_KEYS or key.startswith("setting."):
+        return key
+    if key in SELECTION_KEYS:
+        return (key, bool(rule.get("match_all", False)))
+    return None
+
+
+def _opposing_keys(constraint_key):
+    """
+    Return the index keys of the rules a rule with the given index key can
+    contradict.
+    """
+    if isinstance(constraint_key, tuple):
+        key, match_all = constraint_key
+        if match_all:
+            return [(key, True), (key, False)]
+        return [(key, True)]
+    return [constraint_key]
+
+
+def context_signature(context):
+    """
+    Return a frozenset of (key, operand, required) tuples for the rules of
+    a context list that can make two contexts disjoint.
+    """
+    constraints = set()
+    if not isinstance(context, list):
+        return frozenset()
+
+    for rule in context:
+        if not isinstance(rule, dict) or "key" not in rule:
+            continue
+        key = _constraint_key(rule)
+        if key is None:
+            continue
+        operator = rule.get("operator", "equal")
+        operand = rule.get("operand", True)
+        if operator == "equal":
+            constraints.add((key, _operand_key(operand), True))
+        elif operator == "not_equal":
+            constraints.add((key, _operand_key(operand), False))
+
+    return frozenset(constraints)
+
+
+def find_overlapping_bindings(bucket, display_internal_conflicts):
+    """
+    Return the set of ids of the bindings in the bucket that can be active
+    at the same time as a binding from another package, or from the same
+    package if display_internal_conflicts is set.
+    """
+    signatures = []
+    signature_ids = {}
+    groups = []
+    package_signature_ids = []
+    for package in bucket["packages"]:
+        package_ids = set()
+        for binding in bucket[package]:
+            signature = context_signature(binding.get("context"))
+            signature_id = signature_ids.get(signature)
+            if signature_id is None:
+                signature_id = len(signatures)
+                signature_ids[signature] = signature_id
+                signatures.append(signature)
+                groups.append([])
+            groups[signature_id].append(binding)
+            package_ids.add(signature_id)
+        package_signature_ids.append(package_ids)
+
+    # Index the signatures by the values they require and exclude
+    required = {}
+    excluded = {}
+    constrained = {}
+    for signature_id, signature in enumerate(signatures):
+        for key, operand, is_required in signature:
+            if is_required:
+                required.setdefault(key, {}).setdefault(operand, set()).add(signature_id)
+                constrained.setdefault(key, set()).add(signature_id)
+            else:
+                excluded.setdefault(key, {}).setdefault(operand, set()).add(signature_id)
+
+    overlapping = set()
+    for signature_id, signature in enumerate(signatures):
+        disjoint = set()
+        for constraint_key, operand, is_required in signature:
+            for key in _opposing_keys(constraint_key):
+                if is_required:
+                    disjoint |= constrained.get(key, set()) - required.get(key, {}).get(operand, set())
+                    disjoint |= excluded.get(key, {}).get(operand, set())
+                else:
+                    disjoint |= required.get(key, {}).get(operand, set())
+
+        if _has_conflict(signature_id, disjoint, groups, package_signature_ids,
+                         display_internal_conflicts):
+            for binding in groups[signature_id]:
+                overlapping.add(id(binding))
+
+    return overlapping
+
+
+def _has_conflict(signature_id, disjoint, groups, package_signature_ids,
+                  display_internal_conflicts):
+    """
+    True if the bindings of a signature overlap with bindings of two
+    packages, or with another binding if display_internal_conflicts is
+    set. Stops at the first packages found, so crowded keys are not
+    compared pairwise.
+    """
+    candidate_count = len(groups) - len(disjoint)
+    if display_internal_conflicts:
+        if candidate_count > 1:
+            return True
+        if candidate_count == 1:
+            other_id = signature_id
+            if signature_id in disjoint:
+                other_id = (set(range(len(groups))) - disjoint).pop()
+            if len(groups[other_id]) > 1:
+                return True
+
+    packages = 0
+    for package_ids in package_signature_ids:
+        if not package_ids <= disjoint:
+            packages += 1
+            if packages > 1:
+                return True
+    return False
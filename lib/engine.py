@@ -0,0 +1,1179 @@
+"""
+Scanning, normalization and conflict detection for key bindings.
+
+The editor API is only accessed through the host (see host.py), so this
+module can also be used outside of Sublime Text.
+"""
+import threading
+import logging
+import traceback
+import sys
+import time
+import bisect
+import multiprocessing
+
+from .host import get_host
+from .package_resources import get_packages_list, get_resources, find_keymap_resources
+from .tolerant_json import strip_comments, loads as tolerant_json_loads
+from .keymap_cache import get_keymap_cache, get_package_fingerprint
+from .chords import MODIFIERS, parse_chord, parse_key_sequence, split_key_sequence
+from .binding_store import KeyBucket, binding_store
+from .context_conflicts import find_overlapping_bindings
+from .ignore_patterns import IgnoreMatcher
+from .profiler import create_profiler
+from .text_layout import format_key_line, format_binding_line
+from .parallel import parse_package, expand_batch
+
+__all__ = [
+    "PLATFORM",
+    "PLATFORMS",
+    "MODIFIERS",
+    "SETTINGS_FILE",
+    "logger",
+    "remove_non_conflicts",
+    "find_overlap_conflicts",
+    "find_package_conflicts",
+    "find_unique_conflicts",
+    "remove_ignored_keys",
+    "normalize_key_sequence",
+    "get_keymap_fingerprints",
+    "GenerateText",
+    "CancellationToken",
+    "get_running_scans",
+    "FindKeyConflictsCall",
+    "MultiPlatformCall",
+    "CommandIndex",
+    "KeyMapSnapshot",
+    "KeyMapIndex",
+    "key_map_index",
+    "package_precedence"
+]
+
+# The sublime module, or a stand-in when running outside of the editor
+sublime = get_host()
+
+VERSION = int(sublime.version())
+
+# Worker processes can only be started outside of the editor
+HEADLESS = getattr(sublime, "HEADLESS", False)
+
+PLATFORM = sublime.platform().title()
+if PLATFORM == "Osx":
+    PLATFORM = "OSX"
+
+# Platforms covered by multi-platform scans
+PLATFORMS = ("Linux", "Windows", "OSX")
+
+SETTINGS_FILE = "FindKeyConflicts.sublime-settings"
+
+# Packages a loading thread or process may run ahead of the merge
+LOAD_WINDOW = 2
+
+# Set up logger
+logger = logging.getLogger("FindKeyConflicts")
+logger.setLevel(logging.WARNING)
+
+if not len(logger.handlers):  # Behave better on reloads
+    _handler = logging.StreamHandler(sys.stdout)
+    _formatter = logging.Formatter('[%(name)s] %(levelname)s - %(message)s')
+
+    _handler.setFormatter(_formatter)
+    logger.addHandler(_handler)
+
+
+def remove_non_conflicts(all_key_map, display_internal_conflicts, context_aware=False):
+    """
+    Return the entries of the key map bound by more than one package, or
+    more than once by one package if display_internal_conflicts is set.
+
+    If context_aware is set, bindings whose contexts can never be active at
+    the same time as another binding of the key are left out.
+    """
+    keylist = list(all_key_map.keys())
+
+    keylist.sort()
+    new_key_map = {}
+    for key in keylist:
+        bucket = find_key_conflict(all_key_map[key], display_internal_conflicts, context_aware)
+        if bucket is not None:
+            new_key_map[key] = bucket
+    return new_key_map
+
+
+def find_key_conflict(bucket, display_internal_conflicts, context_aware=False):
+    """
+    Return the conflicting bindings of a key bucket, or None if the key is
+    not a conflict.
+    """
+    packages = bucket["packages"]
+    if len(packages) == 1 and not (display_internal_conflicts and len(bucket[packages[0]]) > 1):
+        return None
+
+    if context_aware:
+        return remove_disjoint_bindings(bucket, display_internal_conflicts)
+    return bucket
+
+
+def remove_disjoint_bindings(bucket, display_internal_conflicts):
+    """
+    Return a bucket with only the bindings that overlap with another
+    binding of the bucket, or None if there are none.
+    """
+    overlapping = find_overlapping_bindings(bucket, display_internal_conflicts)
+    if not overlapping:
+        return None
+
+    packages = []
+    entries = []
+    for package in bucket["packages"]:
+        bindings = [binding for binding in bucket[package] if id(binding) in overlapping]
+        if bindings:
+            packages.append(package)
+            entries.append(bindings)
+    return KeyBucket(packages, entries)
+
+
+def find_overlap_conflicts(all_key_map):
+    """
+    Return a dictionary mapping key strings to the multi part key strings
+    they are a prefix of.
+    """
+    keylist = list(all_key_map.keys())
+    keylist.sort()
+    conflicts = {}
+    for key in keylist:
+        overlaps = find_key_overlaps(key, keylist)
+        if overlaps:
+            conflicts[key] = overlaps
+    return conflicts
+
+
+def find_key_overlaps(key, keylist):
+    """
+    Return the multi part key strings of the sorted keylist that key is a
+    prefix of.
+    """
+    # Every key starting with the prefix sorts into one contiguous run, so
+    # only that run needs to be visited.
+    prefix = key + ","
+    index = bisect.bisect_left(keylist, prefix)
+    overlaps = []
+    while index < len(keylist) and keylist[index].startswith(prefix):
+        overlaps.append(keylist[index])
+        index += 1
+    return overlaps
+
+
+def find_package_conflicts(all_key_map, packages, display_internal_conflicts, context_aware=False):
+    """
+    Return (conflicts, overlap_conflicts) like remove_non_conflicts and
+    find_overlap_conflicts, limited to the conflicts involving one of the
+    specified packages. Only the keys bound by those packages, and the keys
+    they are a prefix of or extend, are visited.
+    """
+    package_keys = get_package_keys(all_key_map)
+    keylist = get_sorted_keys(all_key_map)
+
+    conflicts = {}
+    overlap_conflicts = {}
+    for package in packages:
+        for key in package_keys.get(package, []):
+            if key not in conflicts:
+                bucket = find_key_conflict(all_key_map[key], display_internal_conflicts, context_aware)
+                if bucket is not None and package in bucket["packages"]:
+                    conflicts[key] = bucket
+
+            # The key conflicts with the keys it is a prefix of, and with
+            # the keys it extends.
+            base_keys = [key]
+            for index, character in enumerate(key):
+                if character == "," and key[:index] in all_key_map:
+                    base_keys.append(key[:index])
+            for base_key in base_keys:
+                if base_key not in overlap_conflicts:
+                    overlaps = find_key_overlaps(base_key, keylist)
+                    if overlaps:
+                        overlap_conflicts[base_key] = overlaps
+
+    return conflicts, overlap_conflicts
+
+
+def remove_ignored_keys(all_key_map, ignore_single_key, ignore_patterns):
+    """
+    Return the entries of the key map whose keys are not ignored through
+    the ignore_single_key and ignore_patterns settings. Key maps hold every
+    binding, and conflicts are found in the key map returned by this.
+    """
+    if not ignore_single_key and not ignore_patterns:
+        return all_key_map
+    if isinstance(all_key_map, KeyMapSnapshot):
+        return all_key_map.derive("unignored_keys", build_unignored_key_map,
+                                  ignore_single_key, tuple(ignore_patterns))
+    return build_unignored_key_map(all_key_map, ignore_single_key, ignore_patterns)
+
+
+def build_unignored_key_map(all_key_map, ignore_single_key, ignore_patterns):
+    ignore_matcher = IgnoreMatcher(ignore_patterns, ignore_single_key)
+    key_map = {}
+    for key_string, bucket in all_key_map.items():
+        # All bindings of a key share its chords
+        if not ignore_matcher.matches(bucket[bucket["packages"][0]][0].chords):
+            key_map[key_string] = bucket
+    if isinstance(all_key_map, KeyMapSnapshot):
+        # Conflicts derived from it are shared as well
+        return KeyMapSnapshot(key_map, all_key_map.created)
+    return key_map
+
+
+def find_unique_conflicts(platform_conflicts):
+    """
+    Return a dictionary mapping platforms to the direct conflicts that only
+    exist on that platform, where platform_conflicts maps platforms to their
+    direct conflicts as returned by remove_non_conflicts.
+    """
+    unique_conflicts = {}
+    for platform, conflicts in platform_conflicts.items():
+        other_conflicts = [platform_conflicts[other] for other in platform_conflicts if other != platform]
+        unique_conflicts[platform] = {}
+        for key_string, bucket in conflicts.items():
+            if not [other for other in other_conflicts if key_string in other]:
+                unique_conflicts[platform][key_string] = bucket
+    return unique_conflicts
+
+
+def normalize_key_sequence(key_string):
+    """
+    Return the canonical form of a comma separated key string, as used in
+    the key map, or None if it is empty or has an empty chord.
+    """
+    keys = [key.strip() for key in split_key_sequence(key_string.strip())]
+    if not keys or "" in keys:
+        return None
+    return parse_key_sequence(keys)[1]
+
+
+def get_keymap_fingerprints(packages):
+    """
+    Return a dictionary mapping packages to the fingerprint of their
+    keymap files.
+    """
+    keymap_resources = find_keymap_resources(PLATFORM, packages)
+    fingerprints = {}
+    for package in packages:
+        fingerprints[package] = get_package_fingerprint(package, PLATFORM, keymap_resources.get(package, []))
+    return fingerprints
+
+
+def get_package_keys(all_key_map):
+    """
+    Return a dictionary mapping packages to the key strings they bind.
+    """
+    if isinstance(all_key_map, KeyMapSnapshot):
+        return all_key_map.derive("package_keys", build_package_keys)
+    return build_package_keys(all_key_map)
+
+
+def build_package_keys(all_key_map):
+    package_keys = {}
+    for key_string, bucket in all_key_map.items():
+        for package in bucket["packages"]:
+            package_keys.setdefault(package, []).append(key_string)
+    return package_keys
+
+
+def get_sorted_keys(all_key_map):
+    if isinstance(all_key_map, KeyMapSnapshot):
+        return all_key_map.derive("sorted_keys", sorted)
+    return sorted(all_key_map)
+
+
+class GenerateText(object):
+    """
+    Plain text rendering of key maps and conflicts.
+    """
+    def __init__(self, all_key_map, show_args):
+        self.all_key_map = all_key_map
+        self.show_args = show_args
+
+    def generate_header(self, header):
+        return '%s\n%s\n%s\n' % ('-' * len(header), header, '-' * len(header))
+
+    def generate_overlapping_key_text(self, conflict_map):
+        """
+        Generator yielding the text for each overlapping key.
+        """
+        potential_conflicts_keys = list(conflict_map.keys())
+        potential_conflicts_keys.sort()
+        offset = 2
+        for key_string in potential_conflicts_keys:
+            yield self.generate_text(key_string, self.all_key_map, 0)
+            for conflict in conflict_map[key_string]:
+                yield self.generate_text(conflict, self.all_key_map,
+                                         offset, "(", ")")
+
+    def generate_key_map_text(self, key_map):
+        """
+        Generator yielding the text for each key in the key map.
+        """
+        keys = list(key_map.keys())
+
+        keys.sort()
+        for key_string in keys:
+            yield self.generate_text(key_string, key_map)
+
+    def longest_command_length(self, key_map):
+        pass
+
+    def longest_package_length(self, key_map):
+        pass
+
+    def generate_text(self, key_string, key_map, offset=0, key_wrap_in='[',
+                      key_wrap_out=']'):
+        content = []
+        item = key_map.get(key_string)
+        content.append(format_key_line(key_string, offset, key_wrap_in, key_wrap_out))
+        packages = item.get("packages")
+        misconfigured_command_message = ''
+        for package in packages:
+            package_map = item.get(package)
+            for entry in package_map:
+                if 'command' not in entry:
+                    misconfigured_command_message += '%s in %s does not ' \
+                        'have a command\n' % (key_string, package)
+                    continue
+                content.append(format_binding_line(entry, package, offset))
+
+        if misconfigured_command_message:
+            sublime.error_message(misconfigured_command_message)
+
+        return "".join(content)
+
+
+class CancellationToken(object):
+    """
+    Shared flag used to ask one or more scans to stop.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self):
+        return self.event.is_set()
+
+
+_running_scans = []
+_running_scans_lock = threading.Lock()
+
+
+def get_running_scans():
+    """
+    Return the scan threads that have started but not completed.
+    """
+    with _running_scans_lock:
+        return list(_running_scans)
+
+
+class ThreadBase(threading.Thread):
+    def init_progress(self, cancel_token=None):
+        self.cancel_token = cancel_token or CancellationToken()
+        self.cancelled = False
+        self.failed = False
+        self.completed = False
+        self.progress = (0, 0)
+        self.progress_callbacks = []
+        self.complete_callbacks = []
+        self.callback_lock = threading.Lock()
+        self.result_lock = threading.Lock()
+
+    def add_callbacks(self, on_progress=None, on_complete=None):
+        """
+        Register callbacks, called from the scanning thread. on_progress
+        is called with (thread, done, total) after every package and
+        on_complete with the thread once the scan ended, immediately if
+        it already has.
+        """
+        with self.callback_lock:
+            if on_progress is not None:
+                self.progress_callbacks.append(on_progress)
+            if not self.completed:
+                if on_complete is not None:
+                    self.complete_callbacks.append(on_complete)
+                return
+        if on_complete is not None:
+            on_complete(self)
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def is_cancelled(self):
+        return self.cancel_token.is_cancelled()
+
+    def report_progress(self, done, total):
+        self.progress = (done, total)
+        with self.callback_lock:
+            callbacks = list(self.progress_callbacks)
+        for callback in callbacks:
+            callback(self, done, total)
+
+    def run(self):
+        with _running_scans_lock:
+            _running_scans.append(self)
+        try:
+            self.scan()
+        finally:
+            with _running_scans_lock:
+                _running_scans.remove(self)
+            with self.callback_lock:
+                self.completed = True
+                callbacks = self.complete_callbacks
+                self.complete_callbacks = []
+            for callback in callbacks:
+                callback(self)
+
+    def scan(self):
+        raise NotImplementedError("Should have implemented this")
+
+    def load_packages(self, packages, keymap_resources):
+        """
+        Generator yielding (package, key_maps) in the order of packages,
+        where keymap_resources maps packages to their keymap resources.
+        Up to scan_threads packages are loaded concurrently, but results
+        are always yielded in order so merging stays deterministic. Loading
+        runs at most LOAD_WINDOW results per thread ahead of the consumer.
+        """
+        if self.scan_processes > 1 and len(packages) > 1:
+            for result in self.load_packages_in_processes(packages, keymap_resources):
+                yield result
+            return
+
+        if self.scan_threads <= 1 or len(packages) <= 1:
+            for package in packages:
+                if self.is_cancelled():
+                    return
+                yield package, self.load_package(package, keymap_resources.get(package, []))
+            return
+
+        results = {}
+        next_index = [0]
+        # Index of the next result to yield, None once the consumer stopped
+        next_yield = [0]
+        window = LOAD_WINDOW * self.scan_threads
+        condition = threading.Condition()
+
+        def worker():
+            while True:
+                with condition:
+                    while (next_yield[0] is not None and next_index[0] - next_yield[0] >= window and
+                           not self.is_cancelled()):
+                        condition.wait()
+                    index = next_index[0]
+                    if index >= len(packages) or next_yield[0] is None or self.is_cancelled():
+                        # Wake up the consumer so it notices the cancellation
+                        condition.notify_all()
+                        return
+                    next_index[0] += 1
+                try:
+                    package = packages[index]
+                    result = (self.load_package(package, keymap_resources.get(package, [])), None)
+                except Exception:
+                    result = (None, sys.exc_info()[1])
+                with condition:
+                    results[index] = result
+                    condition.notify_all()
+
+        for i in range(min(self.scan_threads, len(packages))):
+            worker_thread = threading.Thread(target=worker)
+            worker_thread.daemon = True
+            worker_thread.start()
+
+        try:
+            for index, package in enumerate(packages):
+                with condition:
+                    while index not in results and not self.is_cancelled():
+                        condition.wait()
+                    if self.is_cancelled():
+                        return
+                    key_maps, error = results.pop(index)
+                    next_yield[0] = index + 1
+                    condition.notify_all()
+                if error is not None:
+                    raise error
+                yield package, key_maps
+        finally:
+            # Stop the workers that wait for the consumer
+            with condition:
+                next_yield[0] = None
+                condition.notify_all()
+
+    def load_packages_in_processes(self, packages, keymap_resources):
+        """
+        Generator like load_packages, parsing the packages that are not
+        cached in a pool of scan_processes worker processes. Resources are
+        read at most LOAD_WINDOW packages per process ahead of the consumer.
+        """
+        cached_key_maps = {}
+        fingerprints = {}
+        uncached_packages = []
+        for package in packages:
+            keymap_files = keymap_resources.get(package, [])
+            fingerprints[package], key_maps = self.get_cached_key_maps(package, keymap_files)
+            if key_maps is None:
+                uncached_packages.append(package)
+            else:
+                cached_key_maps[package] = key_maps
+
+        window = threading.Semaphore(LOAD_WINDOW * self.scan_processes)
+        stopped = threading.Event()
+
+        def jobs():
+            # Iterated by the task thread of the pool
+            for package in uncached_packages:
+                window.acquire()
+                if stopped.is_set():
+                    return
+                keymap_files = keymap_resources.get(package, [])
+                with self.profiler.time("get_resources", package) as timer:
+                    contents = get_resources(package, keymap_files)
+                    timer.calls = len(keymap_files)
+                    timer.size = sum([len(content) for content in contents.values() if content is not None])
+                yield (package, [(filename, contents[filename]) for filename in keymap_files
+                                 if contents[filename] is not None])
+
+        pool = multiprocessing.Pool(min(self.scan_processes, max(len(uncached_packages), 1)))
+        try:
+            # Results are returned in the order of the jobs
+            results = pool.imap(parse_package, jobs())
+            for package in packages:
+                if self.is_cancelled():
+                    return
+                if package in cached_key_maps:
+                    yield package, cached_key_maps.pop(package)
+                    continue
+
+                with self.profiler.time("parse_processes"):
+                    package, batches, errors = next(results)
+                window.release()
+                for filename, error in errors:
+                    self.report_parse_error(package, filename, error)
+                key_maps = self.collect_key_maps(
+                    [(filename, expand_batch(batch)) for filename, batch in batches])
+                if not errors:
+                    self.cache_key_maps(package, fingerprints[package], key_maps)
+                yield package, key_maps
+        finally:
+            # Wake the task thread, so the pool can stop
+            stopped.set()
+            window.release()
+            pool.terminate()
+            pool.join()
+
+    def get_cached_key_maps(self, package, keymap_files):
+        """
+        Return (fingerprint, key_maps), where key_maps are the cached
+        keymaps of the package or None if the package must be parsed.
+        """
+        fingerprint = None
+        if self.track_fingerprints or (self.keymap_cache is not None and keymap_files):
+            with self.profiler.time("fingerprint", package):
+                fingerprint = get_package_fingerprint(package, PLATFORM, keymap_files)
+            self.package_fingerprints[package] = fingerprint
+
+        if len(keymap_files) == 0:
+            return fingerprint, []
+
+        key_maps = None
+        if self.keymap_cache is not None:
+            with self.profiler.time("keymap_cache", package):
+                key_maps = self.keymap_cache.get(package, fingerprint)
+        return fingerprint, key_maps
+
+    def cache_key_maps(self, package, fingerprint, key_maps):
+        if self.keymap_cache is not None and fingerprint is not None:
+            self.keymap_cache.put(package, fingerprint, key_maps)
+
+    def report_parse_error(self, package, filename, error):
+        if not self.prev_error:
+            if sys.exc_info()[0] is not None:
+                traceback.print_exc()
+            self.prev_error = True
+            sublime.error_message("Could not parse a keymap file. See console for details")
+        logger.warning("FindKeyConflicts[Warning]: An error " + "occured while parsing '" + package + "/" + filename + "': " + str(error))
+
+    def load_package(self, package, keymap_files):
+        """
+        Return the parsed keymaps for the specified keymap resources.
+        """
+        fingerprint, key_maps = self.get_cached_key_maps(package, keymap_files)
+        if key_maps is not None:
+            return key_maps
+
+        parsed_key_maps = []
+        parse_failed = False
+        with self.profiler.time("get_resources", package) as timer:
+            contents = get_resources(package, keymap_files)
+            timer.calls = len(keymap_files)
+            timer.size = sum([len(content) for content in contents.values() if content is not None])
+        for filename in keymap_files:
+            content = contents[filename]
+            if content is None:
+                continue
+
+            try:
+                with self.profiler.time("decode_value", package):
+                    if VERSION < 3013:
+                        if self.debug:
+                            self.debug_minified[package] = strip_comments(content)
+                        key_map = tolerant_json_loads(content)
+                    else:
+                        key_map = sublime.decode_value(content)
+            except:
+                self.report_parse_error(package, filename, sys.exc_info()[1])
+                parse_failed = True
+                continue
+            if key_map is not None:
+                with self.profiler.time("order_key_string", package) as timer:
+                    timer.calls = self.normalize_key_map(key_map)
+                parsed_key_maps.append((filename, key_map))
+
+        key_maps = self.collect_key_maps(parsed_key_maps)
+        # Packages with parse errors are not cached so the error is
+        # reported again on the next run.
+        if not parse_failed:
+            self.cache_key_maps(package, fingerprint, key_maps)
+
+        return key_maps
+
+    def collect_key_maps(self, parsed_key_maps):
+        """
+        Return the keymaps of a package for a list of (filename, key_map)
+        tuples, in the form load_package returns them.
+        """
+        return [key_map for filename, key_map in parsed_key_maps]
+
+    def normalize_key_map(self, key_map):
+        """
+        Normalize the keys of every entry in place. Returns the number of
+        key strings normalized.
+        """
+        count = 0
+        for entry in key_map:
+            if isinstance(entry, dict) and isinstance(entry.get("keys"), list):
+                entry["keys"] = [self.order_key_string(key) for key in entry["keys"]]
+                count += len(entry["keys"])
+        return count
+
+    def save_keymap_cache(self):
+        if self.keymap_cache is None:
+            return
+        try:
+            with self.profiler.time("save_keymap_cache"):
+                self.keymap_cache.save()
+        except (IOError, OSError):
+            logger.warning("FindKeyConflicts[Warning]: Unable to write the keymap cache")
+
+    def order_key_string(self, key_string):
+        return parse_chord(key_string).text
+
+    def handle_key_map(self, package, key_map):
+        raise NotImplementedError("Should have implemented this")
+
+
+class FindKeyConflictsCall(ThreadBase):
+    def __init__(self, settings, packages, cancel_token=None):
+        self.packages = packages
+        self.all_key_map = {}
+        self.debug_minified = {}
+        self.debug = settings.get("debug", False)
+        self.keymap_cache = None
+        # Debug output is generated while parsing, so bypass the cache
+        if settings.get("cache_keymaps", True) and not self.debug:
+            self.keymap_cache = get_keymap_cache()
+        self.scan_threads = settings.get("scan_threads", 4)
+        self.scan_processes = 0
+        if HEADLESS:
+            self.scan_processes = settings.get("scan_processes", 0)
+        self.profiler = create_profiler(settings)
+        self.track_fingerprints = False
+        self.package_fingerprints = {}
+        self.prev_error = False
+        self.init_progress(cancel_token)
+        threading.Thread.__init__(self)
+
+    def scan(self):
+        with self.profiler.time("scan"):
+            self.scan_packages()
+
+    def scan_packages(self):
+        ordered_packages = []
+        if "Default" in self.packages:
+            ordered_packages.append("Default")
+            self.packages.remove("Default")
+        run_user = "User" in self.packages
+        if run_user:
+            self.packages.remove("User")
+        ordered_packages += self.packages
+        if run_user:
+            ordered_packages.append("User")
+
+        with self.profiler.time("find_keymap_resources"):
+            keymap_resources = self.find_package_keymaps(ordered_packages)
+        total = len(ordered_packages)
+        self.report_progress(0, total)
+        try:
+            for done, (package, key_maps) in enumerate(self.load_packages(ordered_packages, keymap_resources)):
+                with self.result_lock:
+                    with self.profiler.time("handle_key_map", package):
+                        self.handle_package(package, key_maps)
+                self.report_progress(done + 1, total)
+        except Exception:
+            # The key map lacks the remaining packages, so it is reported
+            # as a failed scan rather than a result.
+            self.failed = True
+            logger.error("FindKeyConflicts[Error]: The scan failed\n" + traceback.format_exc())
+        self.cancelled = self.progress[0] < total
+        self.save_keymap_cache()
+
+    def find_package_keymaps(self, packages):
+        return find_keymap_resources(PLATFORM, packages)
+
+    def handle_package(self, package, key_maps):
+        for key_map in key_maps:
+            self.handle_key_map(package, key_map)
+
+    def partial_key_map(self):
+        """
+        Return a copy of the bindings merged so far, which can be read
+        while the scan continues.
+        """
+        with self.result_lock:
+            partial_key_map = {}
+            for key_string, bucket in self.all_key_map.items():
+                partial_key_map[key_string] = KeyBucket(
+                    list(bucket.packages), [list(entries) for entries in bucket.entries])
+            return partial_key_map
+
+    def handle_key_map(self, package, key_map):
+        for entry in key_map:
+            chords, key_string = parse_key_sequence(entry["keys"])
+            binding = binding_store.create_binding(package, entry, chords)
+            add_binding(self.all_key_map, key_string, package, binding)
+
+
+def add_binding(all_key_map, key_string, package, binding):
+    bucket = all_key_map.get(key_string)
+    if bucket is None:
+        all_key_map[key_string] = KeyBucket([package], [[binding]])
+    else:
+        bucket.add(package, binding)
+
+
+class KeyMapIndexCall(FindKeyConflictsCall):
+    def __init__(self, index, settings, packages, generation):
+        self.index = index
+        self.generation = generation
+        FindKeyConflictsCall.__init__(self, settings, packages)
+        self.track_fingerprints = True
+        self.replaced_by = None
+
+    def replace(self, thread):
+        """
+        Cancel the scan, handing the callbacks waiting for it over to the
+        thread scanning in its place.
+        """
+        with self.callback_lock:
+            self.replaced_by = thread
+            progress_callbacks = self.progress_callbacks
+            complete_callbacks = self.complete_callbacks
+            self.progress_callbacks = []
+            self.complete_callbacks = []
+        for callback in progress_callbacks:
+            thread.add_callbacks(on_progress=callback)
+        for callback in complete_callbacks:
+            thread.add_callbacks(on_complete=callback)
+        self.cancel()
+
+    def scan(self):
+        active_packages = set(self.packages)
+        FindKeyConflictsCall.scan(self)
+        if not self.cancelled:
+            snapshot = self.index.adopt(self.generation, self.all_key_map, active_packages,
+                                        self.package_fingerprints)
+            if snapshot is not None:
+                # Commands waiting on the scan share the snapshot too
+                self.all_key_map = snapshot
+
+
+class MultiPlatformCall(FindKeyConflictsCall):
+    """
+    Collect the key maps of every platform in one scan. Each keymap file is
+    read and parsed once, and the bindings of the default keymaps are
+    shared by the key maps of all platforms rather than copied.
+    """
+    def __init__(self, settings, packages, cancel_token=None):
+        FindKeyConflictsCall.__init__(self, settings, packages, cancel_token)
+        # Cached keymaps only hold the files of the current platform
+        self.keymap_cache = None
+        self.platform_key_maps = {}
+        for platform in PLATFORMS:
+            self.platform_key_maps[platform] = {}
+        # Partial results show the current platform
+        self.all_key_map = self.platform_key_maps.get(PLATFORM, {})
+
+    def find_package_keymaps(self, packages):
+        return find_keymap_resources(PLATFORMS, packages)
+
+    def collect_key_maps(self, parsed_key_maps):
+        return parsed_key_maps
+
+    def handle_package(self, package, key_maps):
+        for filename, key_map in key_maps:
+            self.handle_key_map(package, key_map, keymap_platforms(filename))
+
+    def handle_key_map(self, package, key_map, platforms=PLATFORMS):
+        for entry in key_map:
+            chords, key_string = parse_key_sequence(entry["keys"])
+            binding = binding_store.create_binding(package, entry, chords)
+            for platform in platforms:
+                add_binding(self.platform_key_maps[platform], key_string, package, binding)
+
+
+def keymap_platforms(filename):
+    """
+    Return the platforms a keymap resource applies to.
+    """
+    filename = filename.lower()
+    for platform in PLATFORMS:
+        if filename.endswith("default (%s).sublime-keymap" % platform.lower()):
+            return (platform,)
+    return PLATFORMS
+
+
+class CommandIndex(object):
+    """
+    The bindings of all packages, ordered by package and command, as
+    listed by Command Search. Entries are (package, key_string, binding)
+    tuples, and the entries of one package are a contiguous range.
+    """
+    def __init__(self, all_key_map):
+        entries = []
+        for key_string, bucket in all_key_map.items():
+            for package in bucket["packages"]:
+                for binding in bucket[package]:
+                    entries.append((package, key_string, binding))
+        entries.sort(key=lambda entry: (package_precedence(entry[0]), str(entry[2].command), entry[1]))
+
+        self.entries = entries
+        self.packages = []
+        self.package_ranges = {}
+        for index, (package, key_string, binding) in enumerate(entries):
+            if package not in self.package_ranges:
+                self.packages.append(package)
+                self.package_ranges[package] = [index, index + 1]
+            else:
+                self.package_ranges[package][1] = index + 1
+
+    def get_entries(self, package=None):
+        """
+        Return the entries of the specified package, or of all packages.
+        """
+        if package is None:
+            return self.entries
+        start, end = self.package_ranges.get(package, (0, 0))
+        return self.entries[start:end]
+
+
+class KeyMapSnapshot(dict):
+    """
+    Read only key map shared by all commands until the bindings change.
+    Conflicts and other indexes derived from it are computed once, on
+    first use, and shared as well.
+    """
+    def __init__(self, all_key_map, created=None):
+        dict.__init__(self, all_key_map)
+        self.created = created if created is not None else time.time()
+        self.lock = threading.Lock()
+        self.derived = {}
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("KeyMapSnapshot is read only")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def derive(self, name, function, *args):
+        """
+        Return function(self, *args), computed once per set of arguments.
+        """
+        key = (name,) + args
+        with self.lock:
+            if key in self.derived:
+                return self.derived[key]
+        value = function(self, *args)
+        with self.lock:
+            # Another thread may have derived the same value meanwhile
+            if key not in self.derived:
+                self.derived[key] = value
+            return self.derived[key]
+
+    def direct_conflicts(self, display_internal_conflicts, context_aware=False):
+        return self.derive("direct_conflicts", remove_non_conflicts,
+                           display_internal_conflicts, context_aware)
+
+    def overlap_conflicts(self):
+        return self.derive("overlap_conflicts", find_overlap_conflicts)
+
+    def command_index(self):
+        return self.derive("command_index", CommandIndex)
+
+    def lookup(self, key_string):
+        """
+        Return (bucket, longer_keys) for a canonical key string, where
+        bucket is None if the key is not bound and longer_keys are the
+        bound key strings it is a prefix of.
+        """
+        return self.get(key_string), find_key_overlaps(key_string, get_sorted_keys(self))
+
+
+class KeyMapIndex(object):
+    """
+    Long lived index of the key bindings for all packages. After the
+    initial scan, only the packages affected by a keymap save or a
+    settings change are scanned again and patched into the key buckets.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.all_key_map = {}
+        self.package_keys = {}
+        self.active_packages = set()
+        self.ready = False
+        self.generation = 0
+        self.build_thread = None
+        self.pending_packages = set()
+        self.current_snapshot = None
+        self.package_fingerprints = {}
+        # Snapshot compared against by the next conflict diff, and the
+        # packages patched since, or None if every package changed.
+        self.baseline = None
+        self.baseline_packages = set()
+
+    def snapshot(self, settings):
+        """
+        Return a KeyMapSnapshot of the key map, or None if the index must
+        be built. The same snapshot is returned until the bindings change.
+        """
+        with self.lock:
+            if not self.ready:
+                return None
+            if self.current_snapshot is None:
+                self.current_snapshot = KeyMapSnapshot(self.all_key_map)
+            return self.current_snapshot
+
+    def build(self, settings):
+        """
+        Start a full scan, unless one is already running, and return the
+        scanning thread. A scan started before the index was invalidated
+        is replaced, since its result would be discarded, and the commands
+        waiting for it wait for the new scan instead.
+        """
+        with self.lock:
+            stale_thread = None
+            if self.build_thread is not None and self.build_thread.is_alive():
+                if self.build_thread.generation == self.generation:
+                    return self.build_thread
+                stale_thread = self.build_thread
+            self.build_thread = KeyMapIndexCall(self, settings, get_packages_list(), self.generation)
+            if stale_thread is not None:
+                stale_thread.replace(self.build_thread)
+            self.build_thread.start()
+            return self.build_thread
+
+    def wait_for_snapshot(self, settings):
+        """
+        Return the snapshot, building the index first if needed. Returns
+        None if the scan was cancelled. Blocks, so it should not be run on
+        the UI thread.
+        """
+        snapshot = self.snapshot(settings)
+        if snapshot is not None:
+            return snapshot
+        thread = self.build(settings)
+        thread.join()
+        while thread.replaced_by is not None:
+            thread = thread.replaced_by
+            thread.join()
+        return self.snapshot(settings)
+
+    def adopt(self, generation, all_key_map, active_packages, package_fingerprints=None):
+        """
+        Use the result of a full scan as the index. Returns the snapshot
+        of the scan result, or None if the index was invalidated meanwhile.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return None
+            # The scan result is also handed to the command that started
+            # the scan, so patch a copy of it.
+            self.all_key_map = dict(all_key_map)
+            self.package_keys = build_package_keys(self.all_key_map)
+            self.active_packages = active_packages
+            self.package_fingerprints = dict(package_fingerprints or {})
+            self.current_snapshot = KeyMapSnapshot(self.all_key_map)
+            self.ready = True
+            snapshot = self.current_snapshot
+            if self.baseline is None:
+                self.baseline = snapshot
+                self.baseline_packages = set()
+            pending_packages = self.pending_packages
+            self.pending_packages = set()
+
+        if pending_packages:
+            self.refresh_packages(pending_packages)
+        return snapshot
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.ready = False
+            self.all_key_map = {}
+            self.package_keys = {}
+            self.pending_packages = set()
+            self.current_snapshot = None
+            self.package_fingerprints = {}
+            self.baseline_packages = None
+
+    def refresh_packages(self, packages):
+        """
+        Scan the specified packages again and patch them into the index.
+        This does file IO, so it should not be run on the UI thread.
+        """
+        settings = sublime.load_settings(SETTINGS_FILE)
+        with self.lock:
+            if not self.ready:
+                if self.build_thread is not None and self.build_thread.is_alive():
+                    self.pending_packages.update(packages)
+                return
+            generation = self.generation
+
+        active_packages = set(get_packages_list())
+        for package in packages:
+            package_key_map = {}
+            fingerprint = None
+            if package in active_packages:
+                thread = FindKeyConflictsCall(settings, [package])
+                thread.track_fingerprints = True
+                thread.run()
+                if thread.cancelled:
+                    # The partial key map lacks bindings of the package, so
+                    # the next command scans every package again.
+                    self.invalidate()
+                    return
+                package_key_map = thread.all_key_map
+                fingerprint = thread.package_fingerprints.get(package)
+
+            with self.lock:
+                if generation != self.generation:
+                    return
+                self.patch_package(package, package_key_map)
+                if package in active_packages:
+                    self.active_packages.add(package)
+                    self.package_fingerprints[package] = fingerprint
+                else:
+                    self.active_packages.discard(package)
+                    self.package_fingerprints.pop(package, None)
+
+    def refresh_changed_packages(self):
+        """
+        Scan the packages whose keymap files changed since they were
+        indexed again. Returns False if the index has not been built.
+        """
+        with self.lock:
+            if not self.ready:
+                return False
+            package_fingerprints = dict(self.package_fingerprints)
+
+        packages = get_packages_list()
+        fingerprints = get_keymap_fingerprints(packages)
+        changed_packages = set([package for package in packages
+                                if package_fingerprints.get(package) != fingerprints[package]])
+        changed_packages.update([package for package in package_fingerprints
+                                 if package not in fingerprints])
+        if changed_packages:
+            self.refresh_packages(changed_packages)
+        return True
+
+    def take_diff_states(self, settings):
+        """
+        Return (baseline, snapshot, packages) for a conflict diff, where
+        packages are the packages patched since the baseline was taken, or
+        None if they all may have changed. The snapshot becomes the
+        baseline of the next diff. Returns None if the index must be built.
+        """
+        with self.lock:
+            snapshot = self.snapshot(settings)
+            if snapshot is None:
+                return None
+            states = (self.baseline, snapshot, self.baseline_packages)
+            self.baseline = snapshot
+            self.baseline_packages = set()
+            return states
+
+    def patch_package(self, package, package_key_map):
+        # Buckets are replaced rather than modified, as earlier snapshots
+        # may still be read by a running command.
+        self.current_snapshot = None
+        if self.baseline_packages is not None:
+            self.baseline_packages.add(package)
+        for key_string in self.package_keys.pop(package, []):
+            bucket = self.all_key_map[key_string]
+            packages = [entry for entry in bucket["packages"] if entry != package]
+            if packages:
+                self.all_key_map[key_string] = self.create_bucket(bucket, packages)
+            else:
+                del self.all_key_map[key_string]
+
+        for key_string, package_bucket in package_key_map.items():
+            bucket = self.all_key_map.get(key_string)
+            if bucket is None:
+                self.all_key_map[key_string] = package_bucket
+            else:
+                packages = sorted(bucket["packages"] + [package], key=package_precedence)
+                self.all_key_map[key_string] = self.create_bucket(bucket, packages, package_bucket)
+
+        if package_key_map:
+            self.package_keys[package] = list(package_key_map.keys())
+
+    def create_bucket(self, bucket, packages, package_bucket=None):
+        entries = []
+        for package in packages:
+            if package in bucket:
+                entries.append(bucket[package])
+            else:
+                entries.append(package_bucket[package])
+        return KeyBucket(packages, entries)
+
+    def on_settings_changed(self):
+        settings = sublime.load_settings(SETTINGS_FILE)
+        with self.lock:
+            if not self.ready:
+                return
+            changed_packages = self.active_packages ^ set(get_packages_list())
+
+        if changed_packages:
+            threading.Thread(target=self.refresh_packages,
+                             args=(changed_packages,)).start()
+
+
+def package_precedence(package):
+    """
+    Sort key matching the order packages are scanned in.
+    """
+    if package == "Default":
+        return (0, package)
+    if package == "User":
+        return (2, package)
+    return (1, package)
+
+
+key_map_index = KeyMapIndex()
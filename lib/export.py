@@ -0,0 +1,110 @@
+"""
+Machine readable export of bindings and conflicts.
+
+Records are generated one binding at a time and written as they are
+produced, as JSON Lines or CSV, so exports of large installs do not hold
+the output in memory.
+"""
+import sys
+import csv
+import json
+
+__all__ = [
+    "EXPORT_FORMATS",
+    "FIELDS",
+    "iter_binding_records",
+    "iter_overlap_records",
+    "write_records",
+    "open_export_file",
+    "export_records"
+]
+
+EXPORT_FORMATS = ("jsonl", "csv")
+
+# "conflict" is "direct", "overlap" or empty for plain mappings, and
+# "prefix" the key string an overlapping binding extends.
+FIELDS = ("keys", "package", "command", "args", "context", "conflict", "prefix")
+
+
+def _record(key_string, package, entry, conflict, prefix):
+    return {
+        "keys": key_string,
+        "package": package,
+        "command": entry.get("command"),
+        "args": entry.get("args"),
+        "context": entry.get("context"),
+        "conflict": conflict,
+        "prefix": prefix
+    }
+
+
+def iter_binding_records(key_map, conflict=""):
+    """
+    Generator yielding a record for every binding in the key map, in key
+    order.
+    """
+    for key_string in sorted(key_map):
+        bucket = key_map[key_string]
+        for package in bucket["packages"]:
+            for entry in bucket[package]:
+                yield _record(key_string, package, entry, conflict, "")
+
+
+def iter_overlap_records(all_key_map, overlap_conflicts):
+    """
+    Generator yielding records for the bindings of every overlap conflict,
+    as returned by find_overlap_conflicts.
+    """
+    for key_string in sorted(overlap_conflicts):
+        for overlap_key in [key_string] + overlap_conflicts[key_string]:
+            prefix = "" if overlap_key == key_string else key_string
+            bucket = all_key_map[overlap_key]
+            for package in bucket["packages"]:
+                for entry in bucket[package]:
+                    yield _record(overlap_key, package, entry, "overlap", prefix)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    if sys.version_info[0] < 3 and not isinstance(value, str):
+        return unicode(value).encode("utf-8")
+    return value
+
+
+def write_records(records, stream, export_format):
+    """
+    Write records to stream in the specified format. Returns the number of
+    records written.
+    """
+    count = 0
+    if export_format == "jsonl":
+        for record in records:
+            stream.write(json.dumps(record, sort_keys=True) + "\n")
+            count += 1
+    elif export_format == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for record in records:
+            writer.writerow([_csv_value(record[field]) for field in FIELDS])
+            count += 1
+    else:
+        raise ValueError("Unknown export format '%s'" % export_format)
+    return count
+
+
+def open_export_file(path, export_format):
+    if sys.version_info[0] < 3:
+        return open(path, "wb")
+    return open(path, "w", encoding="utf-8", newline="" if export_format == "csv" else None)
+
+
+def export_records(records, path, export_format):
+    """
+    Write records to the file at path. Returns the number of records
+    written.
+    """
+    with open_export_file(path, export_format) as stream:
+        return write_records(records, stream, export_format)
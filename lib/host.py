@@ -0,0 +1,31 @@
+"""
+Access to the editor API used by the scanning code.
+
+Inside Sublime Text the host is the sublime module itself. Outside of the
+editor a stand-in providing the same functions (see stub_host.py) can be
+installed with set_host(). Modules read the host when they are imported,
+so set_host() must be called before importing any other module in lib.
+"""
+
+__all__ = [
+    "get_host",
+    "set_host"
+]
+
+_host = None
+
+
+def get_host():
+    """
+    Return the current host, defaulting to the sublime module.
+    """
+    global _host
+    if _host is None:
+        import sublime
+        _host = sublime
+    return _host
+
+
+def set_host(host):
+    global _host
+    _host = host
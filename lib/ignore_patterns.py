@@ -0,0 +1,97 @@
+"""
+Matching of key bindings against the ignore_patterns and ignore_single_key
+settings.
+
+Patterns are compiled once per scan. Patterns without wildcards are kept
+in a set of chord tuples, so looking them up does not depend on the number
+of patterns. Wildcard patterns are stored in a trie of normalized chords,
+which is only walked along the chords of the binding being checked.
+
+A chord written as "*" matches any single chord, or any number of chords
+if it ends the pattern, so "ctrl+k,*" matches every binding starting with
+ctrl+k. A chord of modifiers followed by "*", such as "super+alt+*",
+matches any key pressed with exactly those modifiers.
+"""
+from .chords import parse_chord, parse_key_sequence, split_key_sequence
+
+__all__ = [
+    "IgnoreMatcher"
+]
+
+WILDCARD = "*"
+
+
+class _TrieNode(object):
+    __slots__ = ("children", "modifier_children", "any_child", "end", "rest")
+
+    def __init__(self):
+        # Chord text -> node, for the chords written out in a pattern
+        self.children = {}
+        # Modifier bitmask -> node, for chords such as "super+alt+*"
+        self.modifier_children = {}
+        self.any_child = None
+        # A pattern ends at this node
+        self.end = False
+        # A pattern ending in "*" matches any remaining chords
+        self.rest = False
+
+
+class IgnoreMatcher(object):
+    """
+    Compiled ignore patterns. If ignore_single_key is set, single keys
+    without modifiers are matched as well.
+    """
+    def __init__(self, ignore_patterns, ignore_single_key=False):
+        self.ignore_single_key = ignore_single_key
+        self.exact = set()
+        self.trie = None
+        wildcard_key_id = parse_chord(WILDCARD).key_id
+        for ignore_pattern in ignore_patterns:
+            chords = parse_key_sequence(split_key_sequence(ignore_pattern))[0]
+            if not [chord for chord in chords if chord.key_id == wildcard_key_id]:
+                self.exact.add(chords)
+            else:
+                self.add_wildcard_pattern(chords, wildcard_key_id)
+
+    def add_wildcard_pattern(self, chords, wildcard_key_id):
+        if self.trie is None:
+            self.trie = _TrieNode()
+        node = self.trie
+        for index, chord in enumerate(chords):
+            if chord.key_id != wildcard_key_id:
+                node = node.children.setdefault(chord.text, _TrieNode())
+            elif chord.modifiers:
+                node = node.modifier_children.setdefault(chord.modifiers, _TrieNode())
+            elif index == len(chords) - 1:
+                node.rest = True
+                return
+            else:
+                if node.any_child is None:
+                    node.any_child = _TrieNode()
+                node = node.any_child
+        node.end = True
+
+    def matches(self, chords):
+        """
+        True if the tuple of Chord objects matches one of the patterns.
+        """
+        if chords in self.exact:
+            return True
+        if self.ignore_single_key and len(chords) == 1 and chords[0].is_single_key():
+            return True
+        return self.trie is not None and self._match(self.trie, chords, 0)
+
+    def _match(self, node, chords, index):
+        if index == len(chords):
+            return node.end
+        if node.rest:
+            return True
+
+        chord = chords[index]
+        child = node.children.get(chord.text)
+        if child is not None and self._match(child, chords, index + 1):
+            return True
+        child = node.modifier_children.get(chord.modifiers)
+        if child is not None and self._match(child, chords, index + 1):
+            return True
+        return node.any_child is not None and self._match(node.any_child, chords, index + 1)
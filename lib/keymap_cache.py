@@ -0,0 +1,194 @@
+"""
+Persistent cache of parsed keymap files.
+
+Entries are stored in one file per package and keyed by a fingerprint of
+the files that could contribute keymaps, so a package is only parsed again
+once something on disk has changed, and saving only writes the packages
+parsed since.
+"""
+import os
+import json
+import zipfile
+import hashlib
+import shutil
+import threading
+
+from .host import get_host
+from .package_resources import get_zip_member_crcs
+
+# The sublime module, or a stand-in when running outside of the editor
+sublime = get_host()
+
+__all__ = [
+    "KeymapCache",
+    "get_keymap_cache",
+    "get_package_fingerprint"
+]
+
+VERSION = int(sublime.version())
+CACHE_FORMAT = 2
+PACKAGE_DIRECTORY_NAME = "packages"
+LEGACY_CACHE_FILE_NAME = "keymaps.json"
+
+
+def get_package_fingerprint(package, platform, resources):
+    """
+    Return a fingerprint for the keymap resources of the specified package.
+
+    Loose keymap files contribute their mtime and size, and zipped
+    packages contribute the archive mtime and the CRC of each keymap
+    member. The resource list itself is included, so adding or removing
+    a keymap also changes the fingerprint.
+    """
+    parts = [platform] + list(resources)
+    package_path = os.path.join(sublime.packages_path(), package)
+    for resource in resources:
+        path = os.path.join(package_path, resource)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append("f:%s:%r:%d" % (resource, stat.st_mtime, stat.st_size))
+
+    if VERSION >= 3006:
+        sublime_package = package + ".sublime-package"
+        for packages_path in _zip_locations():
+            zip_path = os.path.join(packages_path, sublime_package)
+            try:
+                crcs = get_zip_member_crcs(zip_path)
+            except (IOError, zipfile.BadZipfile):
+                parts.append("z:%s:unreadable" % zip_path)
+                continue
+            if crcs is None:
+                continue
+            parts.append("z:%s:%r" % (zip_path, os.path.getmtime(zip_path)))
+            for resource in resources:
+                if resource in crcs:
+                    parts.append("m:%s:%d" % (resource, crcs[resource]))
+
+    return hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _zip_locations():
+    return [
+        sublime.installed_packages_path(),
+        os.path.dirname(sublime.executable_path()) + os.sep + "Packages"
+    ]
+
+
+def _default_cache_directory():
+    # sublime.cache_path() is only available in Sublime Text 3
+    if not hasattr(sublime, "cache_path") or sublime.cache_path() is None:
+        return None
+    return os.path.join(sublime.cache_path(), "FindKeyConflicts")
+
+
+class KeymapCache(object):
+    """
+    Cache of the parsed keymaps of each package. Every package is stored in
+    its own file, which is read when the package is looked up and only
+    written again when its entry changes. Entries are not kept in memory
+    once saved, as the scan only needs them to build its bindings.
+    """
+    def __init__(self, cache_directory):
+        self.cache_directory = cache_directory
+        self.lock = threading.Lock()
+        # Package -> entry, for the entries not saved yet
+        self.entries = {}
+
+    def package_directory(self):
+        return os.path.join(self.cache_directory, PACKAGE_DIRECTORY_NAME)
+
+    def cache_file(self, package):
+        name = hashlib.md5(package.encode("utf-8")).hexdigest()
+        return os.path.join(self.package_directory(), name + ".json")
+
+    def get(self, package, fingerprint):
+        """
+        Return the cached keymaps for the package, or None if the cached
+        entry is missing or stale. Keymaps not saved yet are shared with
+        the cache, so they must not be modified.
+        """
+        with self.lock:
+            entry = self.entries.get(package)
+            if entry is None:
+                entry = self._load(package)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                return None
+            return entry["key_maps"]
+
+    def put(self, package, fingerprint, key_maps):
+        """
+        Store the keymaps of the package until the next save. The keymaps
+        are kept without a copy, so they must not be modified afterwards.
+        """
+        with self.lock:
+            self.entries[package] = {
+                "fingerprint": fingerprint,
+                "key_maps": key_maps
+            }
+
+    def save(self):
+        """
+        Write the entries changed since the last save.
+        """
+        with self.lock:
+            if not self.entries:
+                return
+            if not os.path.exists(self.package_directory()):
+                os.makedirs(self.package_directory())
+            for package in sorted(self.entries):
+                entry = self.entries[package]
+                cache_file = self.cache_file(package)
+                temp_file = cache_file + ".tmp"
+                with open(temp_file, "w") as file_obj:
+                    json.dump({"format": CACHE_FORMAT, "package": package,
+                               "fingerprint": entry["fingerprint"],
+                               "key_maps": entry["key_maps"]}, file_obj)
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+                os.rename(temp_file, cache_file)
+            self.entries = {}
+            # Written by earlier versions, which kept every package in one file
+            legacy_file = os.path.join(self.cache_directory, LEGACY_CACHE_FILE_NAME)
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            if os.path.exists(self.package_directory()):
+                shutil.rmtree(self.package_directory())
+            legacy_file = os.path.join(self.cache_directory, LEGACY_CACHE_FILE_NAME)
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+
+    def _load(self, package):
+        cache_file = self.cache_file(package)
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            with open(cache_file, "r") as file_obj:
+                content = json.load(file_obj)
+        except (IOError, ValueError):
+            return None
+        if content.get("format") != CACHE_FORMAT or content.get("package") != package:
+            return None
+        return {
+            "fingerprint": content.get("fingerprint"),
+            "key_maps": content.get("key_maps", [])
+        }
+
+
+_keymap_cache = None
+
+
+def get_keymap_cache():
+    """
+    Return the shared cache, or None if no cache directory is available.
+    """
+    global _keymap_cache
+    if _keymap_cache is None:
+        cache_directory = _default_cache_directory()
+        if cache_directory is None:
+            return None
+        _keymap_cache = KeymapCache(cache_directory)
+    return _keymap_cache
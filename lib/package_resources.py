@@ -4,17 +4,25 @@ Copyright (c) 2013 Scott Kuroda <scott.kuroda@gmail.com>
 
 SHA: d10b8514a1a7c06ef18677ef07256db65aefff4f
 """
-import sublime
 import os
 import zipfile
 import tempfile
 import re
 import codecs
+import threading
+
+from .host import get_host
+
+# The sublime module, or a stand-in when running outside of the editor
+sublime = get_host()
 
 __all__ = [
     "get_resource",
+    "get_resources",
     "get_binary_resource",
     "find_resource",
+    "find_keymap_resources",
+    "get_zip_member_crcs",
     "list_package_files",
     "get_package_and_resource_name",
     "get_packages_list"
@@ -26,6 +34,40 @@ VERSION = int(sublime.version())
 def get_resource(package_name, resource, encoding="utf-8"):
     return _get_resource(package_name, resource, encoding=encoding)
 
+def get_resources(package_name, resources, encoding="utf-8"):
+    """
+    Return a dictionary mapping each of the specified resources to its
+    content. Resources that could not be found are mapped to None. Each
+    package archive is opened at most once.
+    """
+    if VERSION > 3013:
+        content = {}
+        for resource in resources:
+            content[resource] = _get_resource(package_name, resource, encoding=encoding)
+        return content
+
+    content = dict.fromkeys(resources)
+    missing = []
+    packages_path = sublime.packages_path()
+    for resource in resources:
+        path = os.path.join(packages_path, package_name, resource)
+        if os.path.exists(path):
+            content[resource] = _get_directory_item_content(path, False, encoding)
+        if content[resource] is None:
+            missing.append(resource)
+
+    if VERSION >= 3006:
+        sublime_package = package_name + ".sublime-package"
+        for packages_path in [sublime.installed_packages_path(), os.path.dirname(sublime.executable_path()) + os.sep + "Packages"]:
+            if len(missing) == 0:
+                break
+            zip_content = _get_zip_items_content(os.path.join(packages_path, sublime_package), missing, False, encoding)
+            for resource in zip_content:
+                content[resource] = zip_content[resource]
+            missing = [resource for resource in missing if content[resource] is None]
+
+    return content
+
 def get_binary_resource(package_name, resource):
     return _get_resource(package_name, resource, return_binary=True)
 
@@ -83,6 +125,78 @@ def find_resource(resource_pattern, package=None):
     return sorted(ret_list)
 
 
+def find_keymap_resources(platform, packages=None):
+    """
+    Return a dictionary mapping each package to a sorted list of the
+    default and platform specific keymap resources it contains.
+
+    Arguments:
+    platform    Platform name used for the platform specific keymap, or
+                a list of platform names to include the keymaps of several
+                platforms.
+    packages    Optional list of packages to restrict the search to.
+    """
+    platforms = platform if isinstance(platform, (list, tuple)) else [platform]
+    keymap_names = ("default.sublime-keymap",) + tuple(
+        ["default (%s).sublime-keymap" % name.lower() for name in platforms])
+    package_set = None
+    if packages is not None:
+        package_set = set(packages)
+
+    resource_sets = {}
+    def add_resource(package, resource):
+        if package_set is not None and package not in package_set:
+            return
+        if resource.lower().endswith(keymap_names):
+            resource_sets.setdefault(package, set()).add(resource)
+
+    if VERSION > 3013 and hasattr(sublime, "find_resources"):
+        for path in sublime.find_resources("*.sublime-keymap"):
+            package, resource = get_package_and_resource_name(path)
+            add_resource(package, resource)
+    else:
+        packages_path = sublime.packages_path()
+        for package in os.listdir(packages_path):
+            package_path = os.path.join(packages_path, package, "")
+            if package_set is not None and package not in package_set:
+                continue
+            if not os.path.isdir(package_path):
+                continue
+            for root, directories, filenames in os.walk(package_path):
+                # Keymaps are never stored in VCS or dependency folders
+                directories[:] = [directory for directory in directories
+                                  if not directory.startswith(".") and directory != "node_modules"]
+                temp = root.replace(package_path, "")
+                for filename in filenames:
+                    if filename.endswith(".sublime-keymap"):
+                        add_resource(package, _normalize_to_sublime_path(os.path.join(temp, filename)))
+
+        if VERSION >= 3006:
+            for packages_path in [sublime.installed_packages_path(), os.path.dirname(sublime.executable_path()) + os.sep + "Packages"]:
+                for sublime_package in _get_packages_from_directory(packages_path, ".sublime-package"):
+                    if package_set is not None and sublime_package not in package_set:
+                        continue
+                    index = _get_zip_index(os.path.join(packages_path, sublime_package + ".sublime-package"))
+                    if index is None:
+                        continue
+                    for name in index[0]:
+                        add_resource(sublime_package, name)
+
+    resources = {}
+    for package in resource_sets:
+        resources[package] = sorted(resource_sets[package])
+    return resources
+
+def get_zip_member_crcs(path_to_zip):
+    """
+    Return a dictionary mapping the members of the archive to their CRC,
+    or None if the archive does not exist.
+    """
+    index = _get_zip_index(path_to_zip)
+    if index is None:
+        return None
+    return index[2]
+
 def list_package_files(package, ignore_patterns=[]):
     """
     List files in the specified package.
@@ -193,6 +307,8 @@ def get_packages_list(ignore_packages=True):
 
 def _get_packages_from_directory(directory, file_ext=""):
     package_list = []
+    if not os.path.isdir(directory):
+        return package_list
     for package in os.listdir(directory):
         if not package.endswith(file_ext):
             continue
@@ -213,27 +329,62 @@ def _search_for_package_and_resource(path, packages_path):
     return (package, resource)
 
 
+_zip_index = {}
+_zip_index_lock = threading.Lock()
+
+def _get_zip_index(path_to_zip):
+    """
+    Return (namelist, nameset, crcs) for the archive, reading the central
+    directory only if the archive changed since it was last indexed.
+    Returns None if the archive does not exist.
+    """
+    try:
+        stat = os.stat(path_to_zip)
+    except OSError:
+        return None
+
+    signature = (stat.st_mtime, stat.st_size)
+    with _zip_index_lock:
+        entry = _zip_index.get(path_to_zip)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    crcs = {}
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        namelist = zip_file.namelist()
+        for info in zip_file.infolist():
+            crcs[info.filename] = info.CRC
+    index = (namelist, set(namelist), crcs)
+    with _zip_index_lock:
+        _zip_index[path_to_zip] = (signature, index)
+    return index
+
 def _list_files_in_zip(package_path, package):
-    if not os.path.exists(os.path.join(package_path, package)):
+    index = _get_zip_index(os.path.join(package_path, package))
+    if index is None:
         return []
 
-    ret_value = []
-    with zipfile.ZipFile(os.path.join(package_path, package)) as zip_file:
-        ret_value = zip_file.namelist()
-    return ret_value
+    return list(index[0])
 
 def _get_zip_item_content(path_to_zip, resource, return_binary, encoding):
-    if not os.path.exists(path_to_zip):
-        return None
+    return _get_zip_items_content(path_to_zip, [resource], return_binary, encoding).get(resource)
 
-    ret_value = None
+def _get_zip_items_content(path_to_zip, resources, return_binary, encoding):
+    index = _get_zip_index(path_to_zip)
+    if index is None:
+        return {}
+
+    resources = [resource for resource in resources if resource in index[1]]
+    ret_value = {}
+    if len(resources) == 0:
+        return ret_value
 
     with zipfile.ZipFile(path_to_zip) as zip_file:
-        namelist = zip_file.namelist()
-        if resource in namelist:
-            ret_value = zip_file.read(resource)
+        for resource in resources:
+            content = zip_file.read(resource)
             if not return_binary:
-                ret_value = ret_value.decode(encoding)
+                content = content.decode(encoding)
+            ret_value[resource] = content
 
     return ret_value
 
@@ -251,12 +402,11 @@ def _get_directory_item_content(filename, return_binary, encoding):
 
 def _find_zip_resource(path_to_zip, pattern):
     ret_list = []
-    if os.path.exists(path_to_zip):
-        with zipfile.ZipFile(path_to_zip) as zip_file:
-            namelist = zip_file.namelist()
-            for name in namelist:
-                if re.search(pattern, name):
-                    ret_list.append(name)
+    index = _get_zip_index(path_to_zip)
+    if index is not None:
+        for name in index[0]:
+            if re.search(pattern, name):
+                ret_list.append(name)
 
     return ret_list
 
@@ -285,7 +435,10 @@ def extract_zip_resource(path_to_zip, resource, extract_dir=None):
 ####################### Force resource viewer to reload ########################
 import sys
 if VERSION > 3000:
-    from imp import reload
+    try:
+        from imp import reload
+    except ImportError:
+        from importlib import reload
     if "FindKeyConflicts.find_key_conflicts" in sys.modules:
         reload(sys.modules["FindKeyConflicts.find_key_conflicts"])
 else:
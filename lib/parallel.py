@@ -0,0 +1,67 @@
+"""
+Keymap parsing in worker processes.
+
+Decoding and normalizing keymaps is CPU bound, so headless scans can hand
+it to a process pool (see the scan_processes setting). This module does
+not access the host, so it can be imported by freshly started worker
+processes. Workers receive the contents of a package's keymap files and
+return the parsed bindings as compact tuples, which are expanded back to
+keymap entries in the parent.
+"""
+from .tolerant_json import loads as tolerant_json_loads
+from .chords import normalize_key_string
+
+__all__ = [
+    "parse_package",
+    "expand_batch"
+]
+
+BATCH_FIELDS = ("keys", "command", "args", "context")
+
+
+def parse_package(job):
+    """
+    Parse and normalize the keymap files of one package.
+
+    job is a (package, files) tuple, where files is a list of
+    (filename, content) tuples. Returns (package, batches, errors), with
+    a (filename, batch) tuple per keymap file, where batch is a list of
+    (keys, command, args, context) tuples, and a list of
+    (filename, message) tuples for the files that could not be parsed.
+    """
+    package, files = job
+    batches = []
+    errors = []
+    for filename, content in files:
+        try:
+            key_map = tolerant_json_loads(content)
+        except ValueError as error:
+            errors.append((filename, str(error)))
+            continue
+        if key_map is None:
+            continue
+
+        batch = []
+        for entry in key_map:
+            if not isinstance(entry, dict):
+                continue
+            keys = entry.get("keys")
+            if isinstance(keys, list):
+                keys = [normalize_key_string(key) for key in keys]
+            batch.append((keys, entry.get("command"), entry.get("args"), entry.get("context")))
+        batches.append((filename, batch))
+    return package, batches, errors
+
+
+def expand_batch(batch):
+    """
+    Return the keymap entries for a batch returned by parse_package.
+    """
+    key_map = []
+    for values in batch:
+        entry = {}
+        for field, value in zip(BATCH_FIELDS, values):
+            if value is not None:
+                entry[field] = value
+        key_map.append(entry)
+    return key_map
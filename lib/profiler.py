@@ -0,0 +1,146 @@
+"""
+Per phase profiling of scans and report generation.
+
+When the profile setting is enabled, the scan threads and the output code
+record the wall time, number of calls and bytes handled by every phase,
+and per package for the phases that work on a single package. Phases run
+by concurrent scan threads overlap, so their times can add up to more
+than the total scan time.
+"""
+import time
+import threading
+
+__all__ = [
+    "Profiler",
+    "NullProfiler",
+    "create_profiler"
+]
+
+_clock = getattr(time, "perf_counter", time.time)
+
+# Number of packages listed in the slowest packages section of the report
+TOP_PACKAGES = 10
+
+
+class PhaseTimer(object):
+    """
+    Context manager recording one call of a phase. The calls and size
+    attributes may be updated before the block exits.
+    """
+    def __init__(self, profiler, phase, package):
+        self.profiler = profiler
+        self.phase = phase
+        self.package = package
+        self.calls = 1
+        self.size = 0
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.phase, _clock() - self.start,
+                             self.calls, self.size, self.package)
+        return False
+
+
+class NullTimer(object):
+    calls = 0
+    size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+class Profiler(object):
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.phase_order = []
+        self.packages = {}
+
+    def time(self, phase, package=None):
+        return PhaseTimer(self, phase, package)
+
+    def record(self, phase, elapsed, calls=1, size=0, package=None):
+        with self.lock:
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = [0.0, 0, 0]
+                self.phase_order.append(phase)
+            stats[0] += elapsed
+            stats[1] += calls
+            stats[2] += size
+
+            if package is not None:
+                package_stats = self.packages.get(package)
+                if package_stats is None:
+                    package_stats = self.packages[package] = [0.0, 0, {}]
+                package_stats[0] += elapsed
+                package_stats[1] += size
+                package_stats[2][phase] = package_stats[2].get(phase, 0.0) + elapsed
+
+    def generate_report(self, top=TOP_PACKAGES):
+        """
+        Return the profile as text, with phases sorted by time.
+        """
+        with self.lock:
+            phases = [(phase, list(self.phases[phase])) for phase in self.phase_order]
+            packages = [(package, stats[0], stats[1], dict(stats[2]))
+                        for package, stats in self.packages.items()]
+
+        phases.sort(key=lambda entry: -entry[1][0])
+        phase_width = max([len("Phase")] + [len(phase) for phase, stats in phases])
+        lines = [
+            "FindKeyConflicts Profile",
+            "",
+            "%-*s %12s %10s %14s" % (phase_width, "Phase", "Time (ms)", "Calls", "Bytes")
+        ]
+        for phase, stats in phases:
+            lines.append("%-*s %12.1f %10d %14d" % (
+                phase_width, phase, stats[0] * 1000, stats[1], stats[2]))
+
+        packages.sort(key=lambda entry: (-entry[1], entry[0]))
+        packages = packages[:top]
+        package_width = max([len("Package")] + [len(entry[0]) for entry in packages])
+        lines.extend([
+            "",
+            "Slowest packages (%d of %d)" % (len(packages), len(self.packages)),
+            "",
+            "%-*s %12s %14s  %s" % (package_width, "Package", "Time (ms)", "Bytes", "Slowest phase")
+        ])
+        for package, elapsed, size, package_phases in packages:
+            slowest_phase = max(package_phases, key=package_phases.get)
+            lines.append("%-*s %12.1f %14d  %s (%.1f ms)" % (
+                package_width, package, elapsed * 1000, size, slowest_phase,
+                package_phases[slowest_phase] * 1000))
+
+        return "\n".join(lines) + "\n"
+
+
+class NullProfiler(object):
+    """
+    Stand-in used when profiling is disabled.
+    """
+    enabled = False
+    timer = NullTimer()
+
+    def time(self, phase, package=None):
+        return self.timer
+
+    def record(self, phase, elapsed, calls=1, size=0, package=None):
+        pass
+
+
+def create_profiler(settings):
+    if settings.get("profile", False):
+        return Profiler()
+    return NullProfiler()
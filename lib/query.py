@@ -0,0 +1,98 @@
+"""
+Command line entry point querying a binding database written by
+`lib.cli --database`, without scanning the packages again.
+
+Usage:
+    python -m lib.query --database PATH [--format text|jsonl|csv] QUERY...
+
+See binding_db.py for the query syntax.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+
+from .binding_db import BindingDatabase, parse_query
+from .export import EXPORT_FORMATS, iter_binding_records, write_records, open_export_file
+from .text_layout import format_key_line, format_binding_line
+
+__all__ = [
+    "generate_text",
+    "main"
+]
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Query a database of Sublime Text key bindings.")
+    parser.add_argument("query", nargs="+",
+                        help="query terms, such as command:NAME, package:NAME, "
+                             "keys:ctrl+k,* or min_bindings:N")
+    parser.add_argument("--database", required=True,
+                        help="database file written by lib.cli --database")
+    parser.add_argument("--format", default="text", choices=("text",) + EXPORT_FORMATS,
+                        help="output format (default: text)")
+    parser.add_argument("--output", help="write the results to a file")
+    return parser
+
+
+def generate_text(key_map):
+    """
+    Generator yielding the text for each key of the key map, in the layout
+    of the conflict reports.
+    """
+    for key_string in sorted(key_map):
+        bucket = key_map[key_string]
+        content = [format_key_line(key_string)]
+        for package in bucket["packages"]:
+            for entry in bucket[package]:
+                content.append(format_binding_line(entry, package))
+        yield "".join(content)
+
+
+def write_package_counts(package_counts, stream, output_format):
+    if output_format == "jsonl":
+        for package, count in package_counts:
+            stream.write(json.dumps({"package": package, "bindings": count}, sort_keys=True) + "\n")
+    elif output_format == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(("package", "bindings"))
+        writer.writerows(package_counts)
+    else:
+        for package, count in package_counts:
+            stream.write("%-40s %d\n" % (package, count))
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    if not os.path.isfile(args.database):
+        sys.stderr.write("Database '%s' does not exist\n" % args.database)
+        return 2
+    try:
+        query = parse_query(" ".join(args.query))
+    except ValueError as error:
+        sys.stderr.write("%s\n" % error)
+        return 2
+
+    database = BindingDatabase(args.database)
+    stream = sys.stdout
+    if args.output is not None:
+        stream = open_export_file(args.output, args.format)
+    try:
+        if query.min_bindings is not None:
+            write_package_counts(database.count_package_bindings(query), stream, args.format)
+        elif args.format == "text":
+            for chunk in generate_text(database.find_bindings(query)):
+                stream.write(chunk)
+        else:
+            write_records(iter_binding_records(database.find_bindings(query)), stream, args.format)
+    finally:
+        database.close()
+        if stream is not sys.stdout:
+            stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Stand-in for the sublime module, backed by plain directories and zip files.
+
+It provides the subset of the sublime API used by the scanning code, so
+key bindings can be collected and reported outside of the editor.
+"""
+import os
+import sys
+import zipfile
+import fnmatch
+
+from .tolerant_json import loads as tolerant_json_loads
+
+__all__ = [
+    "StubHost",
+    "StubSettings"
+]
+
+
+class StubSettings(object):
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def has(self, key):
+        return key in self.values
+
+    def add_on_change(self, key, callback):
+        pass
+
+    def clear_on_change(self, key):
+        pass
+
+
+class StubHost(object):
+    """
+    Arguments:
+    packages_path           Directory containing loose packages.
+    installed_packages_path Directory containing installed .sublime-package files.
+    executable_path         Path of the editor executable. Shipped packages
+                            are read from the Packages folder next to it.
+    platform                One of "linux", "windows" or "osx".
+    version                 Build number to emulate.
+    settings                Dictionary mapping settings file names to
+                            dictionaries overriding their values.
+    cache_path              Optional cache directory. Keymaps are not
+                            cached if it is omitted.
+    """
+    # Tells the engine it runs outside of the editor
+    HEADLESS = True
+
+    def __init__(self, packages_path, installed_packages_path=None,
+                 executable_path=None, platform="linux", version="3211",
+                 settings=None, cache_path=None):
+        self._packages_path = os.path.abspath(packages_path)
+        self._installed_packages_path = installed_packages_path
+        self._executable_path = executable_path
+        self._platform = platform
+        self._version = str(version)
+        self._settings = {}
+        self._setting_overrides = settings or {}
+        self._cache_path = cache_path
+
+        if self._installed_packages_path is None:
+            self._installed_packages_path = os.path.join(
+                os.path.dirname(self._packages_path), "Installed Packages")
+        if self._executable_path is None:
+            self._executable_path = os.path.join(
+                os.path.dirname(self._packages_path), "bin", "sublime_text")
+
+    def version(self):
+        return self._version
+
+    def platform(self):
+        return self._platform
+
+    def packages_path(self):
+        return self._packages_path
+
+    def installed_packages_path(self):
+        return self._installed_packages_path
+
+    def executable_path(self):
+        return self._executable_path
+
+    def cache_path(self):
+        return self._cache_path
+
+    def load_settings(self, name):
+        if name not in self._settings:
+            values = {}
+            for package in ("Default", "FindKeyConflicts", "User"):
+                path = os.path.join(self._packages_path, package, name)
+                if os.path.exists(path):
+                    with open(path, "r") as file_obj:
+                        content = self.decode_value(file_obj.read())
+                    if isinstance(content, dict):
+                        values.update(content)
+            values.update(self._setting_overrides.get(name, {}))
+            self._settings[name] = StubSettings(values)
+        return self._settings[name]
+
+    def save_settings(self, name):
+        pass
+
+    def decode_value(self, string):
+        return tolerant_json_loads(string)
+
+    def load_resource(self, name):
+        return self.load_binary_resource(name).decode("utf-8")
+
+    def load_binary_resource(self, name):
+        package, resource = name.split("/", 2)[1:]
+        path = os.path.join(self._packages_path, package, resource)
+        if os.path.exists(path):
+            with open(path, "rb") as file_obj:
+                return file_obj.read()
+
+        for path_to_zip in self._package_archives(package):
+            with zipfile.ZipFile(path_to_zip) as zip_file:
+                if resource in zip_file.namelist():
+                    return zip_file.read(resource)
+
+        raise IOError("resource not found: %s" % name)
+
+    def find_resources(self, pattern):
+        resources = set()
+        for package in sorted(os.listdir(self._packages_path)):
+            package_path = os.path.join(self._packages_path, package, "")
+            for root, directories, filenames in os.walk(package_path):
+                for filename in fnmatch.filter(filenames, pattern):
+                    resource = os.path.join(root.replace(package_path, ""), filename)
+                    resources.add("Packages/%s/%s" % (package, resource.replace(os.sep, "/")))
+
+        for directory in self._archive_directories():
+            for archive in os.listdir(directory):
+                if not archive.endswith(".sublime-package"):
+                    continue
+                package = archive[:-len(".sublime-package")]
+                with zipfile.ZipFile(os.path.join(directory, archive)) as zip_file:
+                    for name in zip_file.namelist():
+                        if fnmatch.fnmatch(name.split("/")[-1], pattern):
+                            resources.add("Packages/%s/%s" % (package, name))
+
+        return sorted(resources)
+
+    def error_message(self, message):
+        sys.stderr.write("%s\n" % message)
+
+    def status_message(self, message):
+        pass
+
+    def _archive_directories(self):
+        directories = [
+            self._installed_packages_path,
+            os.path.join(os.path.dirname(self._executable_path), "Packages")
+        ]
+        return [directory for directory in directories if os.path.isdir(directory)]
+
+    def _package_archives(self, package):
+        archives = []
+        for directory in self._archive_directories():
+            path_to_zip = os.path.join(directory, package + ".sublime-package")
+            if os.path.exists(path_to_zip):
+                archives.append(path_to_zip)
+        return archives
@@ -0,0 +1,26 @@
+"""
+Line layout of the plain text reports, shared by the reports of a scan
+and the results of database queries.
+"""
+import json
+
+__all__ = [
+    "format_key_line",
+    "format_binding_line"
+]
+
+
+def format_key_line(key_string, offset=0, key_wrap_in='[', key_wrap_out=']'):
+    """
+    Return the line of a key, above the lines of its bindings.
+    """
+    return '%s %s%s%s\n' % (" " * offset, key_wrap_in, key_string, key_wrap_out)
+
+
+def format_binding_line(entry, package, offset=0):
+    """
+    Return the line of a binding of the package, listed below its key.
+    """
+    return '%s   %*s %*s  %s\n' % (
+        " " * offset, -40 + offset, entry.get("command", ""), -20, package,
+        json.dumps(entry["context"]) if "context" in entry else '')
@@ -0,0 +1,127 @@
+"""
+Tolerant JSON parsing for keymap files.
+
+Keymaps may contain comments and trailing commas. The top level array is
+scanned once: each element is decoded in place by the standard JSON
+decoder, and the whitespace, comments and commas between elements are
+skipped with a regular expression. Only when an element itself contains a
+comment or a trailing comma is the rest of the text blanked out by
+strip_comments, which keeps every other character, including line breaks,
+at its original offset. Error messages therefore always point at the
+offending location of the original file.
+"""
+import re
+import json
+
+__all__ = [
+    "TolerantJSONError",
+    "strip_comments",
+    "loads"
+]
+
+# Block comments must not be able to extend past their first "*/" when
+# the dangling comma lookahead backtracks.
+_COMMENT = r'//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/'
+_TOKEN_RE = re.compile(
+    # ([1st group] strings) | comments | dangling commas
+    r'("[^"\\]*(?:\\.[^"\\]*)*")|%s|,(?=(?:%s|\s)*[\]}])' % (_COMMENT, _COMMENT))
+_GAP_RE = re.compile(r'(?:\s+|%s)*' % _COMMENT)
+_NON_NEWLINE_RE = re.compile(r'[^\n]')
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+class TolerantJSONError(ValueError):
+    def __init__(self, message, text, offset):
+        self.offset = offset
+        self.line = text.count("\n", 0, offset) + 1
+        self.column = offset - text.rfind("\n", 0, offset)
+        ValueError.__init__(self, "%s: line %d column %d (char %d)" % (
+            message, self.line, self.column, offset))
+
+
+def _blank(match):
+    if match.group(1) is not None:
+        return match.group(1)
+    return _NON_NEWLINE_RE.sub(" ", match.group(0))
+
+
+def strip_comments(text):
+    """
+    Return text with comments and dangling commas replaced by spaces.
+    """
+    return _TOKEN_RE.sub(_blank, text)
+
+
+def _skip_gap(text, index):
+    """
+    Return the index of the first character after the whitespace and
+    comments starting at index.
+    """
+    return _GAP_RE.match(text, index).end()
+
+
+class _Scanner(object):
+    """
+    Decoder of the values in a text, which strips the comments from the
+    rest of the text once a value can not be decoded as it is.
+    """
+    def __init__(self, text):
+        self.original = text
+        self.text = text
+        self.stripped = False
+
+    def decode(self, index):
+        try:
+            return _decoder.raw_decode(self.text, index)
+        except ValueError as error:
+            if not self.stripped:
+                # The value contains comments or dangling commas
+                self.text = self.text[:index] + strip_comments(self.text[index:])
+                self.stripped = True
+                return self.decode(index)
+            raise TolerantJSONError(getattr(error, "msg", "Invalid JSON"), self.original,
+                                    getattr(error, "pos", index))
+
+    def error(self, message, index):
+        return TolerantJSONError(message, self.original, index)
+
+
+def _iter_entries(text):
+    """
+    Generator yielding the elements of the top level array in text.
+    """
+    scanner = _Scanner(text)
+    index = _skip_gap(text, 0)
+    if not text.startswith("[", index):
+        raise scanner.error("Expected '['", index)
+
+    index = _skip_gap(text, index + 1)
+    while not scanner.text.startswith("]", index):
+        value, index = scanner.decode(index)
+        yield value
+        index = _skip_gap(scanner.text, index)
+        if scanner.text.startswith(",", index):
+            index = _skip_gap(scanner.text, index + 1)
+        elif not scanner.text.startswith("]", index):
+            raise scanner.error("Expected ',' or ']'", index)
+
+    index = _skip_gap(scanner.text, index + 1)
+    if index != len(text):
+        raise scanner.error("Extra data", index)
+
+
+def loads(text):
+    """
+    Decode text, allowing comments and trailing commas.
+    """
+    index = _skip_gap(text, 0)
+    if text.startswith("[", index):
+        return list(_iter_entries(text))
+
+    scanner = _Scanner(text)
+    value, index = scanner.decode(index)
+    index = _skip_gap(scanner.text, index)
+    if index != len(text):
+        raise scanner.error("Extra data", index)
+    return value
@@ -0,0 +1,28 @@
+import unittest
+
+from lib.chords import clear_memo, parse_chord, parse_key_sequence
+
+
+class ChordTest(unittest.TestCase):
+    def test_spellings_of_a_chord_are_equal(self):
+        chord = parse_chord("shift+ctrl+p")
+        clear_memo()
+        other = parse_chord("ctrl+p+shift")
+        self.assertIsNot(chord, other)
+        self.assertEqual(chord, other)
+        self.assertEqual(hash(chord), hash(other))
+        self.assertEqual(chord.text, "ctrl+shift+p")
+
+    def test_different_chords_are_not_equal(self):
+        self.assertNotEqual(parse_chord("ctrl+p"), parse_chord("ctrl+shift+p"))
+        self.assertNotEqual(parse_chord("ctrl+p"), parse_chord("ctrl+o"))
+        self.assertNotEqual(parse_chord("ctrl+p"), "ctrl+p")
+
+    def test_spellings_of_a_sequence_are_equal(self):
+        chords = parse_key_sequence(["super+alt+k", "shift+ctrl+,"])[0]
+        clear_memo()
+        self.assertEqual(chords, parse_key_sequence(["alt+super+k", "ctrl+shift+,"])[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import time
+import unittest
+
+from lib.context_conflicts import find_overlapping_bindings
+
+
+def bucket(*contexts):
+    """
+    Return a bucket with one binding per context, each from its own package.
+    """
+    packages = []
+    result = {}
+    for index, context in enumerate(contexts):
+        package = "Package%d" % index
+        packages.append(package)
+        binding = {"command": "command_%d" % index}
+        if context is not None:
+            binding["context"] = context
+        result[package] = [binding]
+    result["packages"] = packages
+    return result
+
+
+def rule(key, operand=True, operator="equal", match_all=None):
+    value = {"key": key, "operator": operator, "operand": operand}
+    if match_all is not None:
+        value["match_all"] = match_all
+    return value
+
+
+class FindOverlappingBindingsTest(unittest.TestCase):
+    def assertConflict(self, *contexts):
+        self.assertEqual(len(find_overlapping_bindings(bucket(*contexts), False)), len(contexts))
+
+    def assertNoConflict(self, *contexts):
+        self.assertEqual(find_overlapping_bindings(bucket(*contexts), False), set())
+
+    def test_nested_selectors_overlap(self):
+        self.assertConflict([rule("selector", "source.python")],
+                            [rule("selector", "string.quoted")])
+
+    def test_embedded_selectors_overlap(self):
+        self.assertConflict([rule("selector", "text.html")],
+                            [rule("selector", "source.js")])
+
+    def test_selection_keys_overlap_without_match_all(self):
+        self.assertConflict([rule("selection_empty", True)],
+                            [rule("selection_empty", False)])
+
+    def test_selection_keys_disjoint_with_match_all(self):
+        self.assertNoConflict([rule("selection_empty", True, match_all=True)],
+                              [rule("selection_empty", False)])
+        self.assertNoConflict([rule("selection_empty", True)],
+                              [rule("selection_empty", False, match_all=True)])
+
+    def test_view_keys_disjoint(self):
+        self.assertNoConflict([rule("setting.x", True)], [rule("setting.x", False)])
+        self.assertNoConflict([rule("num_selections", 1)], [rule("num_selections", 2)])
+        self.assertNoConflict([rule("panel_visible", True)],
+                              [rule("panel_visible", True, "not_equal")])
+
+    def test_same_view_values_overlap(self):
+        self.assertConflict([rule("setting.x", True)], [rule("setting.x", True)])
+
+    def test_unknown_keys_overlap(self):
+        self.assertConflict([rule("my_plugin_key", True)], [rule("my_plugin_key", False)])
+
+    def test_missing_context_overlaps(self):
+        self.assertConflict(None, [rule("setting.x", True)])
+
+    def test_crowded_key_is_not_compared_pairwise(self):
+        # Pairwise comparison of this bucket takes minutes
+        crowded = {"packages": ["First", "Second"]}
+        for package in crowded["packages"]:
+            crowded[package] = [{"command": "command", "context": [rule("setting.x%d" % index)]}
+                                for index in range(20000)]
+        start = time.time()
+        overlapping = find_overlapping_bindings(crowded, False)
+        self.assertEqual(len(overlapping), 40000)
+        self.assertLess(time.time() - start, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from lib.tolerant_json import TolerantJSONError, loads
+
+
+class LoadsTest(unittest.TestCase):
+    def test_comments_between_entries(self):
+        text = '// Keymap\n[\n    {"keys": ["ctrl+a"]}, // first\n    /* second */ {"keys": ["ctrl+b"]},\n]\n'
+        self.assertEqual(loads(text), [{"keys": ["ctrl+a"]}, {"keys": ["ctrl+b"]}])
+
+    def test_comments_and_commas_inside_entries(self):
+        text = '[{"keys": ["ctrl+a",], // keys\n "args": {"text": "// kept"},}, {"keys": []}]'
+        self.assertEqual(loads(text), [{"keys": ["ctrl+a"], "args": {"text": "// kept"}},
+                                       {"keys": []}])
+
+    def test_error_offsets_point_into_the_original_text(self):
+        text = '[\n  // comment\n  {"keys": ["ctrl+a"]},\n  {"keys": }\n]'
+        with self.assertRaises(TolerantJSONError) as context:
+            loads(text)
+        self.assertEqual((context.exception.line, context.exception.column), (4, 12))
+
+    def test_extra_data_after_the_array(self):
+        self.assertRaises(TolerantJSONError, loads, '[] x')
+
+
+if __name__ == "__main__":
+    unittest.main()